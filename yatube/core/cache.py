@@ -0,0 +1,543 @@
+"""Кэш в файле SQLite, общий для всех процессов сервера.
+
+LocMemCache у каждого процесса свой: страница кэшируется и прогревается
+отдельно в каждом процессе, а сброс кэша в одном процессе не виден
+другим. SQLiteCache хранит записи в одном файле SQLite (LOCATION) в
+режиме WAL: читатели не блокируют писателя, запись из любого процесса
+сразу видна остальным. Внешний сервис (memcached, Redis) не нужен.
+
+Просроченные записи не возвращаются. При превышении MAX_ENTRIES
+удаляются просроченные записи, затем 1/CULL_FREQUENCY записей, которые
+дольше всех не читали (LRU). Время
+последнего чтения обновляется не чаще раза в ACCESS_RESOLUTION секунд,
+чтобы чтение не превращалось в запись.
+
+LOCATION ':memory:' - кэш в памяти, общий для потоков одного процесса
+(тесты).
+
+TieredCache - двухуровневый кэш: L1 в памяти процесса (LRU с коротким
+сроком жизни L1_TIMEOUT и ограничением объема L1_MAX_BYTES) перед
+общим кэшем L2 (алиас в LOCATION). Горячие ключи читаются без обращения
+к L2. Записи L1 других процессов не сбрасываются, поэтому в L1 попадают
+только неизменяемые по смыслу ключи - версионированные (posts.cache):
+при изменении данных меняется сам ключ. Изменяемые ключи (поколения,
+счетчики) перечисляются в L1_BYPASS и всегда читаются из L2. Доли
+попаданий в каждый уровень копятся в L2 (tier_stats, команда
+cache_stats).
+"""
+import os
+import pickle
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+# не больше параметров в одном запросе (SQLITE_MAX_VARIABLE_NUMBER
+# старых версий SQLite)
+MAX_VARIABLES = 999
+
+SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS cache ('
+    'key TEXT PRIMARY KEY, value BLOB NOT NULL, '
+    'expires REAL, accessed REAL NOT NULL) WITHOUT ROWID',
+    'CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)',
+]
+NOT_EXPIRED = '(expires IS NULL OR expires > ?)'
+
+# значения этих типов хранятся в L1 как есть, остальные - в pickle,
+# чтобы изменение полученного объекта (HttpResponse) не меняло кэш
+IMMUTABLE_TYPES = (str, bytes, int, float, bool, type(None))
+# ключи счетчиков попаданий в L2
+TIER_STATS_KEYS = {
+    'l1_hits': 'cache_stats:l1_hits',
+    'l2_hits': 'cache_stats:l2_hits',
+    'misses': 'cache_stats:misses',
+}
+# через сколько обращений к L1 счетчики процесса добавляются в L2
+TIER_STATS_FLUSH = 100
+
+
+def _chunks(items, size=MAX_VARIABLES):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class SQLiteCache(BaseCache):
+    ACCESS_RESOLUTION = 1
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._busy_timeout = options.get('BUSY_TIMEOUT', 5)
+        if location in ('', ':memory:'):
+            self._path = None
+        else:
+            self._path = os.path.abspath(location)
+        self._local = threading.local()
+
+    @property
+    def _connection(self):
+        """Подключение своего потока; после fork создается новое"""
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            local.connection = self._connect()
+            local.pid = os.getpid()
+        return local.connection
+
+    def _connect(self):
+        if self._path is None:
+            database = (
+                f'file:yatube-cache-{os.getpid()}?mode=memory&cache=shared'
+            )
+        else:
+            os.makedirs(os.path.dirname(self._path), exist_ok=True)
+            database = Path(self._path).as_uri()
+        connection = sqlite3.connect(
+            database,
+            timeout=self._busy_timeout,
+            isolation_level=None,
+            check_same_thread=False,
+            uri=True,
+        )
+        connection.execute('PRAGMA journal_mode = WAL')
+        connection.execute('PRAGMA synchronous = NORMAL')
+        with connection:
+            for statement in SCHEMA:
+                connection.execute(statement)
+        return connection
+
+    def _write(self):
+        """Транзакция записи: блокировка берется сразу, а не при первом
+        изменении, чтобы чтение-изменение-запись (incr) было атомарным
+        """
+        connection = self._connection
+        connection.execute('BEGIN IMMEDIATE')
+        return connection
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _expires(self, timeout):
+        return self.get_backend_timeout(timeout)
+
+    def _touch_accessed(self, keys, now):
+        keys = list(keys)
+        if not keys:
+            return
+        connection = self._connection
+        with connection:
+            for chunk in _chunks(keys):
+                connection.execute(
+                    f'UPDATE cache SET accessed = ? WHERE key IN '
+                    f'({", ".join("?" * len(chunk))})',
+                    [now, *chunk],
+                )
+
+    def _select(self, keys):
+        """{ключ: значение} действующих записей"""
+        now = time.time()
+        found = {}
+        stale = []
+        for chunk in _chunks(keys, MAX_VARIABLES - 1):
+            rows = self._connection.execute(
+                f'SELECT key, value, accessed FROM cache WHERE key IN '
+                f'({", ".join("?" * len(chunk))}) AND {NOT_EXPIRED}',
+                [*chunk, now],
+            )
+            for key, value, accessed in rows:
+                found[key] = pickle.loads(value)
+                if now - accessed > self.ACCESS_RESOLUTION:
+                    stale.append(key)
+        self._touch_accessed(stale, now)
+        return found
+
+    def _cull(self, connection, now):
+        if self._max_entries is None:
+            return
+        count = connection.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if count <= self._max_entries:
+            return
+        connection.execute('DELETE FROM cache WHERE expires <= ?', [now])
+        if self._cull_frequency == 0:
+            connection.execute('DELETE FROM cache')
+            return
+        count = connection.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if count > self._max_entries:
+            connection.execute(
+                'DELETE FROM cache WHERE key IN '
+                '(SELECT key FROM cache ORDER BY accessed LIMIT ?)',
+                [count // self._cull_frequency],
+            )
+
+    def _store(self, connection, items, timeout, only_new=False):
+        """Запись значений; only_new - только на месте отсутствующих
+        или просроченных записей. Возвращает количество записанных
+        """
+        now = time.time()
+        expires = self._expires(timeout)
+        on_conflict = (
+            'DO UPDATE SET value = excluded.value, '
+            'expires = excluded.expires, accessed = excluded.accessed'
+        )
+        if only_new:
+            on_conflict += ' WHERE cache.expires <= excluded.accessed'
+        stored = 0
+        for key, value in items:
+            stored += connection.execute(
+                'INSERT INTO cache (key, value, expires, accessed) '
+                f'VALUES (?, ?, ?, ?) ON CONFLICT (key) {on_conflict}',
+                [key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+                 expires, now],
+            ).rowcount
+        if stored:
+            self._cull(connection, now)
+        return stored
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        with self._write() as connection:
+            return bool(
+                self._store(connection, [(key, value)], timeout, True)
+            )
+
+    def get(self, key, default=None, version=None):
+        key = self._key(key, version)
+        return self._select([key]).get(key, default)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        with self._write() as connection:
+            self._store(connection, [(key, value)], timeout)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        with self._write() as connection:
+            return bool(connection.execute(
+                f'UPDATE cache SET expires = ?, accessed = ? '
+                f'WHERE key = ? AND {NOT_EXPIRED}',
+                [self._expires(timeout), now, key, now],
+            ).rowcount)
+
+    def delete(self, key, version=None):
+        key = self._key(key, version)
+        with self._write() as connection:
+            connection.execute('DELETE FROM cache WHERE key = ?', [key])
+
+    def get_many(self, keys, version=None):
+        keys = {self._key(key, version): key for key in keys}
+        return {
+            keys[key]: value
+            for key, value in self._select(list(keys)).items()
+        }
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        items = [
+            (self._key(key, version), value) for key, value in data.items()
+        ]
+        with self._write() as connection:
+            self._store(connection, items, timeout)
+        return []
+
+    def delete_many(self, keys, version=None):
+        keys = [self._key(key, version) for key in keys]
+        with self._write() as connection:
+            for chunk in _chunks(keys):
+                connection.execute(
+                    f'DELETE FROM cache WHERE key IN '
+                    f'({", ".join("?" * len(chunk))})',
+                    chunk,
+                )
+
+    def has_key(self, key, version=None):
+        key = self._key(key, version)
+        return self._connection.execute(
+            f'SELECT 1 FROM cache WHERE key = ? AND {NOT_EXPIRED}',
+            [key, time.time()],
+        ).fetchone() is not None
+
+    def incr(self, key, delta=1, version=None):
+        """Атомарно для всех процессов: чтение и запись в одной
+        транзакции записи
+        """
+        key = self._key(key, version)
+        now = time.time()
+        with self._write() as connection:
+            row = connection.execute(
+                f'SELECT value FROM cache WHERE key = ? AND {NOT_EXPIRED}',
+                [key, now],
+            ).fetchone()
+            if row is None:
+                raise ValueError(f"Key '{key}' not found")
+            value = pickle.loads(row[0]) + delta
+            connection.execute(
+                'UPDATE cache SET value = ?, accessed = ? WHERE key = ?',
+                [pickle.dumps(value, pickle.HIGHEST_PROTOCOL), now, key],
+            )
+        return value
+
+    def clear(self):
+        with self._write() as connection:
+            connection.execute('DELETE FROM cache')
+
+    def close(self, **kwargs):
+        """Подключения живут весь срок потока: Django вызывает close
+        после каждого запроса, а переподключение дороже самого запроса
+        """
+
+
+class _MemoryTier:
+    """LRU процесса: ключ -> (срок, размер, в pickle ли, значение)"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.counts = dict.fromkeys(TIER_STATS_KEYS, 0)
+
+    def get(self, key, missing):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return missing
+            expires, _, pickled, value = entry
+            if expires <= time.monotonic():
+                self._remove(key)
+                return missing
+            self.entries.move_to_end(key)
+        return pickle.loads(value) if pickled else value
+
+    def set(self, key, value, timeout):
+        pickled = not isinstance(value, IMMUTABLE_TYPES)
+        if pickled:
+            value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        size = sys.getsizeof(value)
+        with self.lock:
+            self._remove(key)
+            if size > self.max_bytes:
+                return
+            self.entries[key] = (
+                time.monotonic() + timeout, size, pickled, value
+            )
+            self.size += size
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+
+    def delete(self, key):
+        with self.lock:
+            self._remove(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+            self.counts = dict.fromkeys(TIER_STATS_KEYS, 0)
+
+    def _remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[1]
+
+    def count(self, name, number=1):
+        """Счетчики попаданий; накопленные за TIER_STATS_FLUSH обращений
+        возвращаются для записи в L2 и обнуляются
+        """
+        with self.lock:
+            self.counts[name] += number
+            if sum(self.counts.values()) < TIER_STATS_FLUSH:
+                return None
+            counts = self.counts
+            self.counts = dict.fromkeys(TIER_STATS_KEYS, 0)
+        return counts
+
+
+# L1 общий для всех потоков процесса (Django создает экземпляр бэкенда
+# кэша в каждом потоке), по одному на алиас L2
+_memory_tiers = {}
+_memory_tiers_lock = threading.Lock()
+
+
+class TieredCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._l2_alias = location
+        self._l1_timeout = options.get('L1_TIMEOUT', 5)
+        self._bypass = tuple(options.get('L1_BYPASS', ()))
+        with _memory_tiers_lock:
+            self._l1 = _memory_tiers.setdefault(
+                location,
+                _MemoryTier(options.get('L1_MAX_BYTES', 32 * 1024 * 1024)),
+            )
+
+    @property
+    def _l2(self):
+        """Бэкенд L2 берется из caches при каждом обращении: экземпляр
+        свой у каждого потока и может быть подменен (debug_toolbar)
+        """
+        return caches[self._l2_alias]
+
+    def _l1_key(self, key, version):
+        """Ключ L1 или None, если ключ читается только из L2"""
+        if key.startswith(self._bypass):
+            return None
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _l1_set(self, l1_key, value, timeout=DEFAULT_TIMEOUT):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self._l2.default_timeout
+        if timeout is not None and timeout <= 0:
+            self._l1.delete(l1_key)
+            return
+        self._l1.set(
+            l1_key, value,
+            self._l1_timeout if timeout is None
+            else min(timeout, self._l1_timeout),
+        )
+
+    def _count(self, name, number=1):
+        if not number:
+            return
+        counts = self._l1.count(name, number)
+        if counts is None:
+            return
+        for stat, number in counts.items():
+            key = TIER_STATS_KEYS[stat]
+            self._l2.add(key, 0, None)
+            try:
+                self._l2.incr(key, number)
+            except ValueError:
+                pass
+
+    def get(self, key, default=None, version=None):
+        l1_key = self._l1_key(key, version)
+        if l1_key is None:
+            return self._l2.get(key, default, version)
+        missing = object()
+        value = self._l1.get(l1_key, missing)
+        if value is not missing:
+            self._count('l1_hits')
+            return value
+        value = self._l2.get(key, missing, version)
+        if value is missing:
+            self._count('misses')
+            return default
+        self._count('l2_hits')
+        self._l1_set(l1_key, value)
+        return value
+
+    def get_many(self, keys, version=None):
+        found = {}
+        l1_keys = {}
+        missing = object()
+        for key in keys:
+            l1_key = self._l1_key(key, version)
+            if l1_key is not None:
+                value = self._l1.get(l1_key, missing)
+                if value is not missing:
+                    found[key] = value
+                    continue
+                l1_keys[key] = l1_key
+        l1_hits = len(found)
+        rest = [key for key in keys if key not in found]
+        from_l2 = self._l2.get_many(rest, version) if rest else {}
+        for key, value in from_l2.items():
+            if key in l1_keys:
+                self._l1_set(l1_keys[key], value)
+        found.update(from_l2)
+        self._count('l1_hits', l1_hits)
+        self._count(
+            'l2_hits', sum(key in from_l2 for key in l1_keys)
+        )
+        self._count(
+            'misses', sum(key not in from_l2 for key in l1_keys)
+        )
+        return found
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self._l2.add(key, value, timeout, version)
+        l1_key = self._l1_key(key, version)
+        if l1_key is not None:
+            if added:
+                self._l1_set(l1_key, value, timeout)
+            else:
+                self._l1.delete(l1_key)
+        return added
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._l2.set(key, value, timeout, version)
+        l1_key = self._l1_key(key, version)
+        if l1_key is not None:
+            self._l1_set(l1_key, value, timeout)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self._l2.set_many(data, timeout, version) or []
+        for key, value in data.items():
+            l1_key = self._l1_key(key, version)
+            if l1_key is not None and key not in failed:
+                self._l1_set(l1_key, value, timeout)
+        return failed
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._l2.touch(key, timeout, version)
+
+    def delete(self, key, version=None):
+        l1_key = self._l1_key(key, version)
+        if l1_key is not None:
+            self._l1.delete(l1_key)
+        return self._l2.delete(key, version)
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        for key in keys:
+            l1_key = self._l1_key(key, version)
+            if l1_key is not None:
+                self._l1.delete(l1_key)
+        self._l2.delete_many(keys, version)
+
+    def has_key(self, key, version=None):
+        l1_key = self._l1_key(key, version)
+        missing = object()
+        if l1_key is not None and self._l1.get(l1_key, missing) is not missing:
+            return True
+        return self._l2.has_key(key, version)
+
+    def incr(self, key, delta=1, version=None):
+        l1_key = self._l1_key(key, version)
+        if l1_key is not None:
+            self._l1.delete(l1_key)
+        return self._l2.incr(key, delta, version)
+
+    def clear(self):
+        """Очищает L2 и L1 этого процесса"""
+        self._l1.clear()
+        self._l2.clear()
+
+    def close(self, **kwargs):
+        self._l2.close(**kwargs)
+
+    def tier_stats(self):
+        """Попадания в L1 и L2 всех процессов и их доли (считаются
+        только ключи, которые могут храниться в L1)
+        """
+        values = self._l2.get_many(list(TIER_STATS_KEYS.values()))
+        stats = {
+            name: values.get(key, 0) for name, key in TIER_STATS_KEYS.items()
+        }
+        lookups = sum(stats.values())
+        l2_lookups = lookups - stats['l1_hits']
+        stats['l1_ratio'] = stats['l1_hits'] / lookups if lookups else 0
+        stats['l2_ratio'] = (
+            stats['l2_hits'] / l2_lookups if l2_lookups else 0
+        )
+        return stats
@@ -0,0 +1,24 @@
+"""Настройка подключений к SQLite.
+
+При создании каждого подключения выполняются PRAGMA из настройки
+SQLITE_PRAGMAS. journal_mode=WAL сохраняется в самом файле БД, остальные
+параметры действуют только на текущее подключение, поэтому применяются
+каждый раз. Для БД в памяти (тесты) WAL недоступен, SQLite оставляет
+режим memory.
+"""
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+def pragma_statements(pragmas):
+    return [f'PRAGMA {name} = {value}' for name, value in pragmas.items()]
+
+
+@receiver(connection_created)
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for statement in pragma_statements(settings.SQLITE_PRAGMAS):
+            cursor.execute(statement)
@@ -0,0 +1,92 @@
+"""Чтение с реплик БД.
+
+View, помеченные read_replica, читают с одной из REPLICA_DATABASES,
+все записи идут в default. После записи в запросе чтение до конца
+запроса идет с default, а ReplicaPinMiddleware ставит cookie, с которой
+следующие REPLICA_LAG_SECONDS секунд пользователь тоже читает с default
+и видит свои изменения, даже если реплика отстает.
+
+Без настроенных реплик роутер направляет все в default.
+"""
+import random
+import threading
+from functools import wraps
+
+from django.conf import settings
+
+PRIMARY = 'default'
+PIN_COOKIE = 'db_primary'
+
+_state = threading.local()
+
+
+def start_request(pinned=False):
+    _state.reading = False
+    _state.pinned = pinned
+    _state.wrote = False
+    _state.used_replica = False
+
+
+def replica_used():
+    """Были ли в текущем запросе чтения с реплики"""
+    return getattr(_state, 'used_replica', False)
+
+
+def read_replica(view_func):
+    """Декоратор view: запросы на чтение идут на реплику"""
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        reading = getattr(_state, 'reading', False)
+        _state.reading = True
+        try:
+            return view_func(request, *args, **kwargs)
+        finally:
+            _state.reading = reading
+    return wrapper
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replicas = settings.REPLICA_DATABASES
+        if (
+            replicas
+            and getattr(_state, 'reading', False)
+            and not getattr(_state, 'pinned', False)
+        ):
+            _state.used_replica = True
+            return random.choice(replicas)
+        return PRIMARY
+
+    def db_for_write(self, model, **hints):
+        _state.pinned = True
+        _state.wrote = True
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.REPLICA_DATABASES:
+            return False
+        return None
+
+
+class ReplicaPinMiddleware:
+    """Закрепляет чтение за основной БД после записи пользователя"""
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.REPLICA_DATABASES:
+            return self.get_response(request)
+        start_request(pinned=PIN_COOKIE in request.COOKIES)
+        response = self.get_response(request)
+        if _state.wrote:
+            response.set_cookie(
+                PIN_COOKIE,
+                '1',
+                max_age=settings.REPLICA_LAG_SECONDS,
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
@@ -0,0 +1,75 @@
+"""Необязательный движок шаблонов Jinja2.
+
+Шаблоны из настройки JINJA2_TEMPLATES рендерятся Jinja2 (их версии лежат
+в templates/jinja2), остальные - шаблонами Django: бэкенд Jinja2 стоит
+в TEMPLATES первым, но для других имен отвечает TemplateDoesNotExist.
+Включенные в шаблон Jinja2 ({% include %}, {% extends %}) берутся из
+templates/jinja2 без ограничений.
+
+В окружении есть аналоги тегов и фильтров шаблонов Django: static, url,
+thumbnail, post_thumbnail, post_picture, post_cards, now, date,
+page_window и addclass.
+"""
+import logging
+
+from django.conf import settings
+from django.template import TemplateDoesNotExist
+from django.template.backends.jinja2 import Jinja2 as Jinja2Backend
+from django.template.defaultfilters import date
+from django.templatetags.static import static
+from django.urls import reverse
+from django.utils import dateformat, timezone
+from jinja2 import Environment
+from sorl.thumbnail import get_thumbnail
+from sorl.thumbnail.conf import settings as thumbnail_settings
+
+from core.templatetags.user_filters import addclass
+from posts.templatetags.posts_tags import (page_window, post_cards,
+                                           post_picture, post_thumbnail)
+
+logger = logging.getLogger(__name__)
+
+
+class Jinja2(Jinja2Backend):
+    def get_template(self, template_name):
+        if template_name not in settings.JINJA2_TEMPLATES:
+            raise TemplateDoesNotExist(template_name, backend=self)
+        return super().get_template(template_name)
+
+
+def url(view_name, *args, **kwargs):
+    return reverse(view_name, args=args, kwargs=kwargs)
+
+
+def now(format_string):
+    return dateformat.format(timezone.localtime(), format_string)
+
+
+def thumbnail(file_, geometry_string, **options):
+    """Миниатюра sorl; ошибки, как и тег thumbnail, пишутся в лог"""
+    try:
+        return get_thumbnail(file_, geometry_string, **options)
+    except Exception:
+        if thumbnail_settings.THUMBNAIL_DEBUG:
+            raise
+        logger.exception('thumbnail %s failed', file_)
+        return None
+
+
+def environment(**options):
+    env = Environment(**options)
+    env.globals.update({
+        'static': static,
+        'url': url,
+        'now': now,
+        'thumbnail': thumbnail,
+        'post_thumbnail': post_thumbnail,
+        'post_picture': post_picture,
+        'post_cards': post_cards,
+    })
+    env.filters.update({
+        'date': date,
+        'page_window': page_window,
+        'addclass': addclass,
+    })
+    return env
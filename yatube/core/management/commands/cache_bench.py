@@ -0,0 +1,90 @@
+import os
+import shutil
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.management.commands.createcachetable import (
+    Command as CreateCacheTable)
+from django.db import connection
+from django.utils.module_loading import import_string
+
+TABLE = 'core_cache_bench'
+
+
+class Command(BaseCommand):
+    help = ('Пропускная способность бэкендов кэша: SQLiteCache против '
+            'LocMemCache, файлового кэша и кэша в БД')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keys', type=int, default=1000)
+        parser.add_argument('--value-size', type=int, default=4096)
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def backends(self, directory):
+        return {
+            'locmem': (
+                'django.core.cache.backends.locmem.LocMemCache', 'bench'
+            ),
+            'sqlite': (
+                'core.cache.SQLiteCache',
+                os.path.join(directory, 'cache.sqlite3'),
+            ),
+            'file': (
+                'django.core.cache.backends.filebased.FileBasedCache',
+                os.path.join(directory, 'file'),
+            ),
+            'db': ('django.core.cache.backends.db.DatabaseCache', TABLE),
+        }
+
+    def operations(self, cache, keys, value):
+        """Операции (название, функция, количество обращений)"""
+        pages = [keys[i:i + 10] for i in range(0, len(keys), 10)]
+        return [
+            ('set', lambda: [cache.set(key, value) for key in keys],
+             len(keys)),
+            ('get', lambda: [cache.get(key) for key in keys], len(keys)),
+            ('get_many(10)', lambda: [cache.get_many(page) for page in pages],
+             len(pages)),
+            ('incr', lambda: [cache.incr('counter') for _ in keys],
+             len(keys)),
+        ]
+
+    def measure(self, cache, keys, value, repeat):
+        cache.clear()
+        cache.set('counter', 0)
+        results = {}
+        for name, operation, count in self.operations(cache, keys, value):
+            best = None
+            for _ in range(repeat):
+                started = time.perf_counter()
+                operation()
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+            results[name] = count / best
+        cache.clear()
+        return results
+
+    def handle(self, *args, **options):
+        keys = [f'bench:{i}' for i in range(options['keys'])]
+        value = 'x' * options['value_size']
+        directory = tempfile.mkdtemp()
+        create_cache_table = CreateCacheTable()
+        create_cache_table.verbosity = 0
+        create_cache_table.create_table('default', TABLE, dry_run=False)
+        try:
+            for name, (backend, location) in self.backends(
+                directory
+            ).items():
+                cache = import_string(backend)(
+                    location, {'OPTIONS': {'MAX_ENTRIES': len(keys) * 2}}
+                )
+                results = self.measure(cache, keys, value, options['repeat'])
+                self.stdout.write(f'{name}: ' + ', '.join(
+                    f'{operation} {rate:.0f}/с'
+                    for operation, rate in results.items()
+                ))
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute(f'DROP TABLE {TABLE}')
+            shutil.rmtree(directory, ignore_errors=True)
@@ -0,0 +1,19 @@
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = ('Попадания в уровни кэша (L1 в памяти процессов, общий L2) '
+            'по всем процессам сервера')
+
+    def handle(self, *args, **options):
+        if not hasattr(cache, 'tier_stats'):
+            raise CommandError('Кэш default - не TieredCache')
+        stats = cache.tier_stats()
+        self.stdout.write(
+            f'L1: попаданий {stats["l1_hits"]} '
+            f'({stats["l1_ratio"]:.1%} обращений)\n'
+            f'L2: попаданий {stats["l2_hits"]} '
+            f'({stats["l2_ratio"]:.1%} промахов L1)\n'
+            f'Промахов: {stats["misses"]}'
+        )
@@ -0,0 +1,104 @@
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connections
+
+TABLE = 'core_db_bench'
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный тест БД: чтение и запись из нескольких потоков '
+            'во временную таблицу')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8)
+        parser.add_argument('--seconds', type=float, default=5)
+        parser.add_argument(
+            '--write-ratio', type=float, default=0.2,
+            help='доля операций записи (0..1)',
+        )
+        parser.add_argument('--rows', type=int, default=10000)
+        parser.add_argument('--database', default='default')
+
+    def setup_table(self, alias, rows):
+        with connections[alias].cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {TABLE}')
+            cursor.execute(
+                f'CREATE TABLE {TABLE} '
+                '(id INTEGER PRIMARY KEY, value INTEGER NOT NULL)'
+            )
+            cursor.executemany(
+                f'INSERT INTO {TABLE} (id, value) VALUES (%s, %s)',
+                [(pk, 0) for pk in range(1, rows + 1)],
+            )
+
+    def worker(self, alias, deadline, write_ratio, rows, stats, lock):
+        reads = writes = errors = 0
+        connection = connections[alias]
+        try:
+            with connection.cursor() as cursor:
+                while time.monotonic() < deadline:
+                    pk = random.randint(1, rows)
+                    try:
+                        if random.random() < write_ratio:
+                            cursor.execute(
+                                f'UPDATE {TABLE} SET value = value + 1 '
+                                'WHERE id = %s',
+                                [pk],
+                            )
+                            writes += 1
+                        else:
+                            cursor.execute(
+                                f'SELECT value FROM {TABLE} WHERE id = %s',
+                                [pk],
+                            )
+                            cursor.fetchone()
+                            reads += 1
+                    except OperationalError:
+                        errors += 1
+        finally:
+            connection.close()
+        with lock:
+            stats['reads'] += reads
+            stats['writes'] += writes
+            stats['errors'] += errors
+
+    def handle(self, *args, **options):
+        alias = options['database']
+        rows = options['rows']
+        seconds = options['seconds']
+        self.setup_table(alias, rows)
+        with connections[alias].cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            journal_mode = cursor.fetchone()[0]
+        stats = {'reads': 0, 'writes': 0, 'errors': 0}
+        lock = threading.Lock()
+        deadline = time.monotonic() + seconds
+        threads = [
+            threading.Thread(
+                target=self.worker,
+                args=(alias, deadline, options['write_ratio'], rows,
+                      stats, lock),
+            )
+            for _ in range(options['workers'])
+        ]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+        with connections[alias].cursor() as cursor:
+            cursor.execute(f'DROP TABLE {TABLE}')
+        self.stdout.write(
+            f'journal_mode: {journal_mode}, '
+            f'PRAGMA: {settings.SQLITE_PRAGMAS}\n'
+            f'Потоков: {options["workers"]}, время: {elapsed:.1f} с\n'
+            f'Чтений: {stats["reads"]} ({stats["reads"] / elapsed:.0f}/с)\n'
+            f'Записей: {stats["writes"]} '
+            f'({stats["writes"] / elapsed:.0f}/с)\n'
+            f'Ошибок блокировки: {stats["errors"]}'
+        )
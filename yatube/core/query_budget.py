@@ -0,0 +1,85 @@
+"""Бюджет SQL-запросов для view-функций.
+
+Декоратор query_budget объявляет, сколько запросов к БД может сделать
+view вместе с рендерингом шаблона. При превышении бюджета пишется
+предупреждение в лог, а при QUERY_BUDGET_RAISE = True выбрасывается
+QueryBudgetExceeded - так N+1 в шаблонах видно сразу при разработке.
+QueryBudgetTestMixin проверяет объявленный бюджет в тестах.
+"""
+import logging
+from contextlib import ExitStack
+from functools import wraps
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class QueryCounter:
+    """Считает запросы ко всем подключениям (execute_wrapper)"""
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries.append(sql)
+        return execute(sql, params, many, context)
+
+
+def query_budget(max_queries):
+    """Декоратор view: не больше max_queries запросов к БД за запрос"""
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            counter = QueryCounter()
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(counter))
+                response = view_func(request, *args, **kwargs)
+            used = len(counter.queries)
+            if used > max_queries:
+                message = (
+                    f'{view_func.__module__}.{view_func.__name__}: '
+                    f'{used} queries, budget {max_queries} ({request.path})'
+                )
+                if settings.QUERY_BUDGET_RAISE:
+                    raise QueryBudgetExceeded(message)
+                logger.warning(message)
+            return response
+        wrapper.query_budget = max_queries
+        return wrapper
+    return decorator
+
+
+class QueryBudgetTestMixin:
+    """Проверка бюджета запросов view, объявленного через query_budget"""
+    def assertWithinQueryBudget(self, client, url):
+        view = resolve(urlsplit(url).path).func
+        budget = getattr(view, 'query_budget', None)
+        self.assertIsNotNone(budget, f'{url}: бюджет запросов не объявлен')
+        with ExitStack() as stack:
+            contexts = [
+                stack.enter_context(
+                    CaptureQueriesContext(connections[alias])
+                )
+                for alias in self.databases
+            ]
+            response = client.get(url)
+        queries = [
+            query['sql'] for context in contexts
+            for query in context.captured_queries
+        ]
+        self.assertLessEqual(
+            len(queries),
+            budget,
+            f'{url}: {len(queries)} запросов при бюджете {budget}:\n'
+            + '\n'.join(queries)
+        )
+        return response
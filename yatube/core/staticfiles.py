@@ -0,0 +1,246 @@
+"""Статика с хэшами в именах и заранее сжатыми копиями.
+
+PrecompressedManifestStorage при collectstatic:
+- удаляет из файлов STATIC_PRUNE_CSS правила, классы которых не
+  встречаются ни в одном шаблоне (prune_css);
+- записывает копии файлов с хэшем содержимого в имени (как
+  ManifestStaticFilesStorage) - их можно кэшировать навсегда;
+- рядом с текстовыми файлами кладет сжатые <имя>.gz.
+
+serve отдает статику из STATIC_ROOT, если перед Django нет веб-сервера:
+клиенту, принимающему gzip, - сжатую копию.
+"""
+import gzip
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.base import ContentFile
+from django.http import FileResponse, Http404
+from django.utils._os import safe_join
+from django.utils.cache import patch_vary_headers
+
+COMPRESSIBLE_EXTENSIONS = (
+    '.css', '.js', '.svg', '.ico', '.txt', '.html', '.json', '.xml', '.map'
+)
+FUNCTIONAL_PSEUDO = re.compile(r':(?:not|is|where|has)\([^()]*\)')
+ATTRIBUTE = re.compile(r'\[[^\]]*\]')
+CLASS_NAME = re.compile(r'\.(-?[_a-zA-Z][\w-]*)')
+LEADING_COMMENTS = re.compile(r'((?:\s*/\*.*?\*/)*\s*)(.*)', re.S)
+HASHED_NAME = re.compile(r'\.[0-9a-f]{12}\.[^/.]+$')
+GZIP_TOKEN = re.compile(r'(?:^|,)\s*gzip\s*(?:;\s*q=([0-9.]+))?', re.I)
+CACHE_FOREVER = 'public, max-age=31536000, immutable'
+
+
+def template_words(directories):
+    """Все слова из шаблонов: среди них имена всех используемых классов"""
+    words = set()
+    for directory in directories:
+        for root, _, files in os.walk(directory):
+            for filename in files:
+                with open(os.path.join(root, filename),
+                          encoding='utf-8', errors='ignore') as file:
+                    words.update(re.findall(r'[\w-]+', file.read()))
+    return words
+
+
+def _skip(css, i):
+    """Индекс после строки или комментария, начинающихся в i"""
+    if css.startswith('/*', i):
+        end = css.find('*/', i + 2)
+        return len(css) if end < 0 else end + 2
+    quote = css[i]
+    i += 1
+    while i < len(css) and css[i] != quote:
+        i += 2 if css[i] == '\\' else 1
+    return i + 1
+
+
+def _rules(css):
+    """Правила верхнего уровня: (заголовок, блок); у правил без блока
+    (@charset, @import) блок None
+    """
+    rules = []
+    start = i = 0
+    depth = 0
+    block_start = None
+    while i < len(css):
+        char = css[i]
+        if char in '"\'' or css.startswith('/*', i):
+            i = _skip(css, i)
+            continue
+        if char == '{':
+            if depth == 0:
+                block_start = i
+            depth += 1
+        elif char == '}':
+            depth -= 1
+            if depth == 0:
+                rules.append((css[start:block_start], css[block_start + 1:i]))
+                start = i + 1
+        elif char == ';' and depth == 0:
+            rules.append((css[start:i + 1], None))
+            start = i + 1
+        i += 1
+    if css[start:].strip():
+        rules.append((css[start:], None))
+    return rules
+
+
+def _split_selectors(prelude):
+    selectors = []
+    start = depth = 0
+    for i, char in enumerate(prelude):
+        if char in '([':
+            depth += 1
+        elif char in ')]':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            selectors.append(prelude[start:i])
+            start = i + 1
+    selectors.append(prelude[start:])
+    return selectors
+
+
+def _selector_used(selector, words):
+    """Селектор может совпасть с разметкой шаблонов: все его классы
+    (кроме упомянутых в :not() и подобных) есть в шаблонах
+    """
+    bare = ATTRIBUTE.sub('', selector)
+    while True:
+        stripped = FUNCTIONAL_PSEUDO.sub('', bare)
+        if stripped == bare:
+            break
+        bare = stripped
+    return all(name in words for name in CLASS_NAME.findall(bare))
+
+
+def prune_css(css, words):
+    """CSS без селекторов с классами, которых нет в words. @media без
+    оставшихся правил удаляются, остальные @-правила не меняются
+    """
+    output = []
+    for prelude, block in _rules(css):
+        if block is None:
+            output.append(prelude)
+            continue
+        comments, header = LEADING_COMMENTS.match(prelude).groups()
+        if header.startswith(('@media', '@supports')):
+            inner = prune_css(block, words)
+            if inner.strip():
+                output.append(f'{prelude}{{{inner}}}')
+            continue
+        if header.startswith('@'):
+            output.append(f'{prelude}{{{block}}}')
+            continue
+        selectors = [
+            selector for selector in _split_selectors(header)
+            if _selector_used(selector, words)
+        ]
+        if selectors:
+            output.append(f'{comments}{",".join(selectors)}{{{block}}}')
+        elif comments.strip():
+            output.append(comments)
+    return ''.join(output)
+
+
+class PrecompressedManifestStorage(ManifestStaticFilesStorage):
+    def stored_name(self, name):
+        """Без манифеста (collectstatic не запускался - разработка,
+        тесты) используется исходное имя файла
+        """
+        if not self.hashed_files:
+            return name
+        return super().stored_name(name)
+
+    def prune(self, paths):
+        """Удаляет неиспользуемые правила из собранных копий
+        STATIC_PRUNE_CSS; хэшированные имена строятся уже по ним
+        """
+        words = template_words(
+            directory
+            for engine in settings.TEMPLATES for directory in engine['DIRS']
+        )
+        words.update(settings.STATIC_PRUNE_KEEP)
+        for name in settings.STATIC_PRUNE_CSS:
+            if name not in paths:
+                continue
+            with self.open(name) as file:
+                css = file.read().decode()
+            pruned = prune_css(css, words)
+            self.delete(name)
+            self._save(name, ContentFile(pruned.encode()))
+            paths[name] = (self, name)
+
+    def compress(self, name):
+        if not name.endswith(COMPRESSIBLE_EXTENSIONS):
+            return
+        with self.open(name) as file:
+            data = file.read()
+        compressed = gzip.compress(data, compresslevel=9, mtime=0)
+        if len(compressed) >= len(data):
+            return
+        if self.exists(f'{name}.gz'):
+            self.delete(f'{name}.gz')
+        self._save(f'{name}.gz', ContentFile(compressed))
+
+    def post_process(self, paths, dry_run=False, **options):
+        if dry_run:
+            yield from super().post_process(paths, dry_run, **options)
+            return
+        self.prune(paths)
+        processed = {}
+        for name, hashed_name, done in super().post_process(
+            paths, dry_run, **options
+        ):
+            if hashed_name and not isinstance(done, Exception):
+                processed[name] = hashed_name
+            yield name, hashed_name, done
+        for name, hashed_name in processed.items():
+            self.compress(name)
+            if hashed_name != name:
+                self.compress(hashed_name)
+
+
+def accepts_gzip(accept_encoding):
+    match = GZIP_TOKEN.search(accept_encoding)
+    if match is None:
+        return False
+    quality = match.group(1)
+    try:
+        return quality is None or float(quality) > 0
+    except ValueError:
+        return False
+
+
+def serve(request, path):
+    """Файл из STATIC_ROOT; сжатая копия - клиенту, принимающему gzip.
+    Файлы с хэшем в имени кэшируются навсегда
+    """
+    try:
+        full_path = safe_join(settings.STATIC_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404
+    if not os.path.isfile(full_path):
+        raise Http404
+    content_type, encoding = mimetypes.guess_type(full_path)
+    compressed = f'{full_path}.gz'
+    if (
+        encoding is None
+        and accepts_gzip(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        and os.path.isfile(compressed)
+    ):
+        full_path, encoding = compressed, 'gzip'
+    response = FileResponse(
+        open(full_path, 'rb'),
+        content_type=content_type or 'application/octet-stream',
+    )
+    if encoding:
+        response['Content-Encoding'] = encoding
+    patch_vary_headers(response, ('Accept-Encoding',))
+    if HASHED_NAME.search(path):
+        response['Cache-Control'] = CACHE_FOREVER
+    return response
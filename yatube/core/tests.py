@@ -1,6 +1,35 @@
+import gzip
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
 from http import HTTPStatus
+from io import StringIO
+from unittest import mock, skipUnless
 
-from django.test import TestCase
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management import call_command
+from django.db import connection
+from django.http import HttpResponse
+from django.test import (RequestFactory, TestCase, TransactionTestCase,
+                         override_settings)
+
+from core.cache import TIER_STATS_FLUSH, SQLiteCache, TieredCache
+from core.db_router import (PIN_COOKIE, ReplicaPinMiddleware,
+                            ReplicaRouter, read_replica)
+from core.query_budget import QueryBudgetExceeded, query_budget
+from core.staticfiles import accepts_gzip, prune_css
+
+User = get_user_model()
+
+
+def increment(location, times):
+    cache = SQLiteCache(location, {})
+    for _ in range(times):
+        cache.incr('counter')
 
 
 class ViewTestClass(TestCase):
@@ -8,3 +37,369 @@ class ViewTestClass(TestCase):
         response = self.client.get('/nonexist-page/')
         self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
         self.assertTemplateUsed(response, 'core/404.html')
+
+
+class QueryBudgetTest(TestCase):
+    def make_view(self, queries):
+        @query_budget(1)
+        def view(request):
+            for _ in range(queries):
+                User.objects.exists()
+            return HttpResponse()
+        return view
+
+    def test_view_within_budget(self):
+        view = self.make_view(1)
+        self.assertEqual(view.query_budget, 1)
+        self.assertEqual(
+            view(RequestFactory().get('/')).status_code, HTTPStatus.OK
+        )
+
+    @override_settings(QUERY_BUDGET_RAISE=True)
+    def test_budget_exceeded_raises(self):
+        with self.assertRaises(QueryBudgetExceeded):
+            self.make_view(2)(RequestFactory().get('/'))
+
+    @override_settings(QUERY_BUDGET_RAISE=False)
+    def test_budget_exceeded_logged(self):
+        with self.assertLogs('core.query_budget', 'WARNING'):
+            self.make_view(2)(RequestFactory().get('/'))
+
+
+class SQLitePragmasTest(TestCase):
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_pragmas_applied_on_connect(self):
+        """PRAGMA из SQLITE_PRAGMAS действуют в подключении"""
+        self.assertEqual(self.pragma('synchronous'), 1)
+        self.assertEqual(self.pragma('cache_size'), -64000)
+        self.assertEqual(self.pragma('temp_store'), 2)
+
+
+@override_settings(REPLICA_DATABASES=['replica'])
+class ReplicaRouterTest(TestCase):
+    def setUp(self):
+        self.router = ReplicaRouter()
+        self.factory = RequestFactory()
+
+    def run_view(self, view, cookies=None):
+        request = self.factory.get('/')
+        request.COOKIES.update(cookies or {})
+        return ReplicaPinMiddleware(view)(request)
+
+    def test_read_views_use_replica(self):
+        """Чтение в view с read_replica идет на реплику, остальное -
+        на основную БД
+        """
+        reads = []
+
+        @read_replica
+        def view(request):
+            reads.append(self.router.db_for_read(User))
+            return HttpResponse()
+
+        def plain_view(request):
+            reads.append(self.router.db_for_read(User))
+            return HttpResponse()
+
+        response = self.run_view(view)
+        self.run_view(plain_view)
+        self.assertEqual(reads, ['replica', 'default'])
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    def test_write_pins_reads_to_primary(self):
+        """После записи чтение идет с основной БД: до конца запроса
+        и, по cookie, в следующих запросах
+        """
+        reads = []
+
+        @read_replica
+        def view(request):
+            reads.append(self.router.db_for_read(User))
+            self.assertEqual(self.router.db_for_write(User), 'default')
+            reads.append(self.router.db_for_read(User))
+            return HttpResponse()
+
+        response = self.run_view(view)
+        self.assertEqual(reads, ['replica', 'default'])
+        cookie = response.cookies[PIN_COOKIE]
+        self.assertEqual(cookie['max-age'], settings.REPLICA_LAG_SECONDS)
+        reads.clear()
+        self.run_view(view, cookies={PIN_COOKIE: cookie.value})
+        self.assertEqual(reads, ['default', 'default'])
+
+    def test_replicas_not_migrated(self):
+        self.assertFalse(self.router.allow_migrate('replica', 'posts'))
+        self.assertIsNone(self.router.allow_migrate('default', 'posts'))
+
+
+@skipUnless('replica' in settings.DATABASES, 'Реплика не настроена')
+@override_settings(REPLICA_DATABASES=['replica'])
+class ReplicaSyncTest(TransactionTestCase):
+    """Реплика - отдельный файл БД (settings_test), который обновляет
+    только sync_replica
+    """
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        call_command('sync_replica', stdout=StringIO())
+        User.objects.create_user(username='Writer')
+
+    def run_view(self, view, cookies=None):
+        request = RequestFactory().get('/')
+        request.COOKIES.update(cookies or {})
+        return ReplicaPinMiddleware(view)(request)
+
+    def test_read_after_write_pinned_to_primary(self):
+        """Реплика отстает от основной БД; после записи чтение идет
+        с основной, пока действует cookie
+        """
+        reads = []
+
+        @read_replica
+        def view(request):
+            reads.append(User.objects.filter(username='Writer').exists())
+            return HttpResponse()
+
+        @read_replica
+        def write_view(request):
+            User.objects.create_user(username='Reader')
+            reads.append(User.objects.filter(username='Writer').exists())
+            return HttpResponse()
+
+        self.run_view(view)
+        response = self.run_view(write_view)
+        self.run_view(view, cookies={
+            PIN_COOKIE: response.cookies[PIN_COOKIE].value
+        })
+        self.assertEqual(reads, [False, True, True])
+
+    def test_sync_replica(self):
+        """sync_replica копирует в реплику записи основной БД"""
+        self.assertFalse(
+            User.objects.using('replica').filter(username='Writer').exists()
+        )
+        call_command('sync_replica', stdout=StringIO())
+        self.assertTrue(
+            User.objects.using('replica').filter(username='Writer').exists()
+        )
+
+
+class StaticFilesTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.static_root = tempfile.mkdtemp()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(cls.static_root, ignore_errors=True)
+
+    def test_prune_css(self):
+        css = (
+            '@charset "UTF-8";/*! license */.used,.unused{color:red}'
+            '.unused{color:blue}.used:not(.unused)>b{margin:0}'
+            '@media (min-width:576px){.unused{padding:0}}'
+            '@media print{.used .unused{x:y}.used{a:b}}'
+        )
+        self.assertEqual(
+            prune_css(css, {'used'}),
+            '@charset "UTF-8";/*! license */.used{color:red}'
+            '.used:not(.unused)>b{margin:0}@media print{.used{a:b}}',
+        )
+
+    def test_accepts_gzip(self):
+        self.assertTrue(accepts_gzip('gzip, deflate, br'))
+        self.assertTrue(accepts_gzip('br;q=1.0, gzip;q=0.8'))
+        self.assertFalse(accepts_gzip('gzip;q=0'))
+        self.assertFalse(accepts_gzip('br'))
+
+    def test_collectstatic_hashed_precompressed(self):
+        """collectstatic пишет файлы с хэшем и сжатые копии, стили
+        Bootstrap без неиспользуемых правил; сжатая копия отдается
+        клиенту, принимающему gzip
+        """
+        with override_settings(STATIC_ROOT=self.static_root):
+            call_command('collectstatic', interactive=False, verbosity=0)
+            with open(os.path.join(
+                self.static_root, 'staticfiles.json'
+            )) as file:
+                paths = json.load(file)['paths']
+            css = paths['css/bootstrap.min.css']
+            self.assertRegex(css, r'^css/bootstrap\.min\.[0-9a-f]{12}\.css$')
+            source = os.path.join(
+                settings.BASE_DIR, 'static', 'css', 'bootstrap.min.css'
+            )
+            path = os.path.join(self.static_root, css)
+            self.assertLess(os.path.getsize(path), os.path.getsize(source))
+            with open(path, 'rb') as file:
+                content = file.read()
+            self.assertIn(b'.card{', content)
+            self.assertNotIn(b'.carousel', content)
+            self.assertIn(
+                staticfiles_storage.url('css/bootstrap.min.css'),
+                self.client.get('/about/author/').content.decode(),
+            )
+
+            response = self.client.get(
+                f'/static/{css}', HTTP_ACCEPT_ENCODING='gzip, br'
+            )
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            self.assertEqual(response['Content-Type'], 'text/css')
+            self.assertIn('Accept-Encoding', response['Vary'])
+            self.assertIn('immutable', response['Cache-Control'])
+            self.assertEqual(
+                gzip.decompress(b''.join(response.streaming_content)),
+                content,
+            )
+            response = self.client.get(f'/static/{css}')
+            self.assertFalse(response.has_header('Content-Encoding'))
+            self.assertEqual(b''.join(response.streaming_content), content)
+            response = self.client.get('/static/../manage.py')
+            self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+
+class SQLiteCacheTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.location = os.path.join(self.directory, 'cache.sqlite3')
+
+    def make_cache(self, **options):
+        return SQLiteCache(self.location, {'OPTIONS': options})
+
+    def test_shared_between_instances(self):
+        """Запись одного экземпляра (процесса) сразу видна другому"""
+        first, second = self.make_cache(), self.make_cache()
+        first.set('key', {'value': 1})
+        self.assertEqual(second.get('key'), {'value': 1})
+        self.assertFalse(second.add('key', 2))
+        second.delete('key')
+        self.assertIsNone(first.get('key'))
+        self.assertTrue(first.add('key', 3))
+        self.assertEqual(second.get_many(['key', 'missing']), {'key': 3})
+
+    def test_expired_entries(self):
+        cache = self.make_cache()
+        cache.set('key', 1, 0)
+        self.assertIsNone(cache.get('key'))
+        self.assertFalse(cache.has_key('key'))
+        self.assertTrue(cache.add('key', 2))
+        self.assertEqual(cache.get('key'), 2)
+
+    def test_lru_eviction(self):
+        """При переполнении удаляются записи, которые дольше всех
+        не читали
+        """
+        cache = self.make_cache(MAX_ENTRIES=4, CULL_FREQUENCY=2)
+        cache.ACCESS_RESOLUTION = -1
+        for key in 'abcd':
+            cache.set(key, key)
+        cache.get('a')
+        cache.get('b')
+        cache.set('e', 'e')
+        self.assertEqual(
+            set(cache.get_many('abcde')), {'a', 'b', 'e'}
+        )
+
+    def test_incr_atomic_across_processes(self):
+        cache = self.make_cache()
+        cache.set('counter', 0)
+        context = multiprocessing.get_context('fork')
+        processes = [
+            context.Process(target=increment, args=(self.location, 50))
+            for _ in range(4)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        self.assertEqual(cache.get('counter'), 200)
+        with self.assertRaises(ValueError):
+            cache.incr('missing')
+
+
+@override_settings(CACHES={
+    'default': {
+        'BACKEND': 'core.cache.TieredCache',
+        'LOCATION': 'l2',
+        'OPTIONS': {'L1_BYPASS': ['gen:'], 'L1_MAX_BYTES': 10000},
+    },
+    'l2': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+})
+class TieredCacheTest(TestCase):
+    def setUp(self):
+        self.cache = TieredCache(
+            'l2',
+            settings.CACHES['default'],
+        )
+        self.l2 = self.cache._l2
+        self.cache.clear()
+
+    def test_l1_serves_hot_keys(self):
+        """Прочитанный ключ берется из L1, пока не истек его срок"""
+        self.cache.set('card', 'html')
+        self.l2.set('card', 'changed')
+        self.assertEqual(self.cache.get('card'), 'html')
+        self.assertEqual(self.cache.get_many(['card']), {'card': 'html'})
+        self.cache._l1_timeout = 0
+        self.cache.set('page', 'old')
+        self.l2.set('page', 'new')
+        self.assertEqual(self.cache.get('page'), 'new')
+
+    def test_bypass_keys_read_from_l2(self):
+        self.cache.set('gen:posts', 1)
+        self.l2.incr('gen:posts')
+        self.assertEqual(self.cache.get('gen:posts'), 2)
+        self.assertEqual(self.cache.incr('gen:posts'), 3)
+
+    def test_l2_set_many_without_result(self):
+        """Обертки бэкендов (debug_toolbar) возвращают из set_many None"""
+        set_many = self.l2.set_many
+
+        def wrapped(*args, **kwargs):
+            set_many(*args, **kwargs)
+
+        with mock.patch.object(self.l2, 'set_many', wrapped):
+            self.assertEqual(self.cache.set_many({'a': 1, 'b': 2}), [])
+        self.assertEqual(self.cache.get_many(['a', 'b']), {'a': 1, 'b': 2})
+
+    def test_mutable_values_copied(self):
+        self.cache.set('page', {'headers': []})
+        self.cache.get('page')['headers'].append('Vary')
+        self.assertEqual(self.cache.get('page'), {'headers': []})
+
+    def test_l1_size_bounded(self):
+        for i in range(20):
+            self.cache.set(f'key{i}', 'x' * 1000)
+        self.assertLessEqual(self.cache._l1.size, 10000)
+        self.assertEqual(self.cache.get('key0'), 'x' * 1000)
+        self.assertNotIn(
+            self.cache.make_key('key1'), self.cache._l1.entries
+        )
+
+    def test_tier_stats(self):
+        """Счетчики процесса добавляются в L2 каждые TIER_STATS_FLUSH
+        обращений; ключи в обход L1 не считаются
+        """
+        self.cache.set('hot', 1)
+        self.l2.set('cold', 1)
+        self.cache.get('cold')
+        for _ in range(TIER_STATS_FLUSH // 2 - 1):
+            self.cache.get('hot')
+            self.cache.get('gen:posts')
+            self.cache.get('missing')
+        self.assertEqual(self.cache.tier_stats()['l1_hits'], 0)
+        self.cache.get('hot')
+        self.cache.get('missing')
+        stats = self.cache.tier_stats()
+        self.assertEqual(
+            (stats['l1_hits'], stats['l2_hits'], stats['misses']),
+            (TIER_STATS_FLUSH // 2, 1, TIER_STATS_FLUSH // 2 - 1),
+        )
+        self.assertAlmostEqual(stats['l1_ratio'], 0.5)
+        self.assertAlmostEqual(stats['l2_ratio'], 1 / 50)
@@ -1,6 +1,8 @@
 from django.contrib import admin
 
+from .forms import PostAdminForm
 from .models import Comment, Follow, Group, Post
+from .search import fts_available, match_expression, matching_ids
 
 
 class PostAdmin(admin.ModelAdmin):
@@ -16,6 +18,33 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ('pub_date',)
     list_editable = ('group',)
     empty_value_display = '-пусто-'
+    form = PostAdminForm
+
+    def save_model(self, request, obj, form, change):
+        """При изменении сохраняются только поля формы, как в post_edit:
+        comments_count, прочитанный до сохранения, затер бы комментарии,
+        добавленные за это время
+        """
+        if not change:
+            return super().save_model(request, obj, form, change)
+        fields = [
+            field.name for field in obj._meta.concrete_fields
+            if field.name in form.fields and not field.primary_key
+        ]
+        if 'image' in fields:
+            fields += ['image_width', 'image_height']
+        obj.save(update_fields=fields)
+
+    def get_search_results(self, request, queryset, search_term):
+        """Поиск по полнотекстовому индексу вместо LIKE '%...%'"""
+        if not search_term or not fts_available():
+            return super().get_search_results(
+                request, queryset, search_term
+            )
+        expression = match_expression(search_term)
+        if expression is None:
+            return queryset.none(), False
+        return queryset.filter(pk__in=matching_ids(expression)), False
 
 
 class GroupAdmin(admin.ModelAdmin):
@@ -0,0 +1,211 @@
+"""Версионированный кэш страниц лент.
+
+Каждая область данных (все посты, группы, пользователи, посты группы
+или автора) имеет в кэше номер поколения. Сигналы изменения Post, Group,
+User и Follow увеличивают номера затронутых областей, а ключ страницы
+включает номера всех областей, от которых она зависит. Поэтому страница
+может храниться долго и все равно обновляется сразу после записи.
+
+Тем же способом кэшируются отрендеренные карточки постов: ключ карточки
+зависит от поколений самого поста, его автора и группы.
+
+Поколения хранятся в общем кэше и переживают перезапуск, поэтому ключи
+страниц и карточек включают еще версию разметки FEED_CACHE_VERSION:
+HTML, отрендеренный прежними шаблонами, после выкладки не отдается.
+
+Из тех же поколений строятся ETag страниц (conditional_page): клиент,
+у которого страница не устарела, получает 304 без выполнения view.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.cache import (get_cache_key, learn_cache_key,
+                                patch_vary_headers)
+from django.views.decorators.http import condition
+
+from core.db_router import replica_used
+from .thumbnails import placeholders_rendered, prefetch_thumbnails
+
+GENERATION_PREFIX = 'gen:'
+
+
+def _initial_generation():
+    """Начальный номер поколения растет со временем: если ключ поколения
+    вытеснен из кэша, новая нумерация не совпадет со старыми страницами
+    """
+    return int(time.time() * 1000000)
+
+
+def get_generations(scopes):
+    """Номера поколений областей (одним запросом к кэшу)"""
+    keys = [GENERATION_PREFIX + scope for scope in scopes]
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            cache.add(key, _initial_generation(), None)
+            generations[key] = cache.get(key)
+    return [generations[key] for key in keys]
+
+
+def card_scopes(post):
+    """Области, от которых зависит карточка поста"""
+    scopes = [f'card:post:{post.pk}', f'card:user:{post.author_id}']
+    if post.group_id is not None:
+        scopes.append(f'card:group:{post.group_id}')
+    return scopes
+
+
+def bump(*scopes):
+    """Новое поколение областей: страницы, зависящие от них, устаревают"""
+    for scope in scopes:
+        key = GENERATION_PREFIX + scope
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, _initial_generation(), None)
+
+
+def cache_timeout(timeout):
+    """Прочитанное с реплики могло отстать от основной БД: такие данные
+    кэшируются не дольше допустимого отставания реплики
+    """
+    if replica_used():
+        return min(timeout, settings.REPLICA_LAG_SECONDS)
+    return timeout
+
+
+def versioned_key(name, scopes):
+    """Ключ, меняющийся при смене поколения любой из областей"""
+    generations = ':'.join(
+        f'{scope}={generation}'
+        for scope, generation in zip(scopes, get_generations(scopes))
+    )
+    digest = hashlib.md5(generations.encode()).hexdigest()
+    return f'{name}:{digest}'
+
+
+def cache_feed(scopes):
+    """Кэширование страницы ленты с версионированным ключом.
+    scopes(request, *args, **kwargs) - области, от которых зависит страница
+    (None - страницы нет, ответ не кэшируется).
+    Ответ варьируется по Cookie: залогиненные пользователи видят свою
+    версию страницы
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view_func(request, *args, **kwargs)
+            page_scopes = scopes(request, *args, **kwargs)
+            if page_scopes is None:
+                return view_func(request, *args, **kwargs)
+            key_prefix = versioned_key(
+                f'feed:{settings.FEED_CACHE_VERSION}:{view_func.__name__}',
+                page_scopes,
+            )
+            cache_key = get_cache_key(request, key_prefix, 'GET', cache=cache)
+            if cache_key is not None:
+                response = cache.get(cache_key)
+                if response is not None:
+                    return response
+            placeholders = placeholders_rendered()
+            response = view_func(request, *args, **kwargs)
+            patch_vary_headers(response, ('Cookie',))
+            if (
+                response.status_code != 200
+                or response.streaming
+                or not request.COOKIES and response.cookies
+                or placeholders_rendered() != placeholders
+            ):
+                return response
+            timeout = cache_timeout(settings.FEED_CACHE_TIMEOUT)
+            cache_key = learn_cache_key(
+                request, response, timeout, key_prefix, cache=cache
+            )
+            cache.set(cache_key, response, timeout)
+            return response
+        return wrapper
+    return decorator
+
+
+def conditional_page(scopes):
+    """Условный GET: на запрос с совпавшим If-None-Match view не
+    выполняется, ответ - 304.
+    scopes(request, *args, **kwargs) - области страницы (None - страницы
+    нет). ETag меняется при смене поколения любой области (в том числе при
+    правке и удалении) и версии разметки FEED_CACHE_VERSION, у каждого
+    пользователя он свой.
+    Last-Modified не отдается: даты публикации не меняются при правке и
+    удалении, а время смены поколений не хранится.
+    Без ETag отдаются страницы с заглушками миниатюр (готовая миниатюра
+    не меняет поколений) и страницы, прочитанные с реплики (она могла
+    отстать от поколений)
+    """
+    def decorator(view_func):
+        def etag(request, *args, **kwargs):
+            page_scopes = scopes(request, *args, **kwargs)
+            if not page_scopes:
+                return None
+            page_version = versioned_key(
+                f'page:{view_func.__name__}', page_scopes
+            )
+            return hashlib.md5(
+                f'{settings.FEED_CACHE_VERSION}:{page_version}:'
+                f'{request.user.pk}'.encode()
+            ).hexdigest()
+
+        conditional_view = condition(etag_func=etag)(view_func)
+
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            placeholders = placeholders_rendered()
+            response = conditional_view(request, *args, **kwargs)
+            if replica_used() or placeholders_rendered() != placeholders:
+                del response['ETag']
+            patch_vary_headers(response, ('Cookie',))
+            return response
+        return wrapper
+    return decorator
+
+
+def render_post_cards(posts, show_author=True):
+    """HTML карточек постов: готовые берутся из кэша одним get_many,
+    рендерятся и кладутся в кэш только отсутствующие
+    """
+    posts = list(posts)
+    scopes = list(dict.fromkeys(
+        scope for post in posts for scope in card_scopes(post)
+    ))
+    generations = dict(zip(scopes, get_generations(scopes)))
+    keys = []
+    for post in posts:
+        versions = '.'.join(
+            str(generations[scope]) for scope in card_scopes(post)
+        )
+        keys.append(
+            f'post_card:{settings.FEED_CACHE_VERSION}:{int(show_author)}:'
+            f'{post.pk}:{versions}'
+        )
+    cards = cache.get_many(keys)
+    prefetch_thumbnails(
+        post for key, post in zip(keys, posts) if key not in cards
+    )
+    missed = {}
+    for key, post in zip(keys, posts):
+        if key not in cards:
+            placeholders = placeholders_rendered()
+            cards[key] = render_to_string(
+                'posts/includes/post_card.html',
+                {'post': post, 'show_author': show_author},
+            )
+            if placeholders_rendered() == placeholders:
+                missed[key] = cards[key]
+    if missed:
+        cache.set_many(
+            missed, cache_timeout(settings.POST_CARD_CACHE_TIMEOUT)
+        )
+    return [cards[key] for key in keys]
@@ -0,0 +1,105 @@
+"""Денормализованные счетчики: посты, подписчики и подписки пользователя
+(UserStats), комментарии поста (Post.comments_count).
+
+Счетчики меняются сигналами F-выражениями (UPDATE ... SET n = n + 1),
+поэтому параллельные записи не теряют изменений; view, создающие и
+удаляющие записи, выполняются в одной транзакции с изменением счетчиков.
+Отсутствующая строка UserStats при записи не создается (пользователь
+может удаляться в этот момент), а пересчитывается по таблицам при первом
+чтении - user_stats().
+Разошедшиеся счетчики исправляет команда rebuild_counters.
+"""
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from .cache import bump
+from .models import Comment, Follow, Post, UserStats
+
+User = get_user_model()
+
+
+def rebuild_user_stats(user_id):
+    """Пересчитывает счетчики пользователя по таблицам"""
+    stats, _ = UserStats.objects.update_or_create(
+        user_id=user_id,
+        defaults={
+            'posts_count': Post.objects.filter(author_id=user_id).count(),
+            'followers_count': Follow.objects.filter(
+                author_id=user_id
+            ).count(),
+            'following_count': Follow.objects.filter(
+                user_id=user_id
+            ).count(),
+        },
+    )
+    return stats
+
+
+def rebuild_comments_count(post_id):
+    Post.objects.filter(pk=post_id).update(
+        comments_count=Comment.objects.filter(post_id=post_id).count()
+    )
+
+
+def change_user_stat(user_id, field, delta):
+    UserStats.objects.filter(user_id=user_id).update(
+        **{field: Greatest(F(field) + delta, 0)}
+    )
+
+
+def change_comments_count(post_id, delta):
+    Post.objects.filter(pk=post_id).update(
+        comments_count=Greatest(F('comments_count') + delta, 0)
+    )
+
+
+def user_stats(user):
+    """Счетчики пользователя (строка создается при отсутствии)"""
+    try:
+        return user.stats
+    except UserStats.DoesNotExist:
+        return rebuild_user_stats(user.pk)
+
+
+def _count(model, field):
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')}).order_by().values(
+            field
+        ).annotate(total=Count('pk')).values('total'),
+        output_field=IntegerField(),
+    ), 0)
+
+
+def rebuild_counters():
+    """Пересчитывает все счетчики, исправляя разошедшиеся.
+    Возвращает количество исправленных (пользователей, постов)
+    """
+    users = User.objects.annotate(
+        posts_total=_count(Post, 'author'),
+        followers_total=_count(Follow, 'author'),
+        following_total=_count(Follow, 'user'),
+    ).values_list('pk', 'posts_total', 'followers_total', 'following_total')
+    stats = {
+        row[0]: row[1:] for row in UserStats.objects.values_list(
+            'user_id', 'posts_count', 'followers_count', 'following_count'
+        )
+    }
+    users_fixed = 0
+    for pk, *totals in users.iterator():
+        if stats.get(pk) == tuple(totals):
+            continue
+        UserStats.objects.update_or_create(user_id=pk, defaults=dict(zip(
+            ('posts_count', 'followers_count', 'following_count'), totals
+        )))
+        users_fixed += 1
+    posts_fixed = Post.objects.annotate(
+        comments_total=_count(Comment, 'post')
+    ).exclude(comments_count=F('comments_total')).update(
+        comments_count=_count(Comment, 'post')
+    )
+    if users_fixed:
+        bump('users')
+    if posts_fixed:
+        bump('posts')
+    return users_fixed, posts_fixed
@@ -0,0 +1,267 @@
+"""Лента подписок: гибрид записи при публикации и чтения при запросе.
+
+Посты обычных авторов раскладываются в таблицу TimelineEntry всем
+подписчикам при публикации (push), при подписке лента подписчика
+дополняется постами автора, при отписке - очищается от них.
+
+Посты знаменитостей (UserStats.celebrity) по лентам не раскладываются:
+при чтении они выбираются из posts_post (pull) и сливаются с записями
+ленты по дате публикации. Автор становится знаменитостью при подписке,
+когда подписчиков стало не меньше FEED_CELEBRITY_FOLLOWERS, а снова
+обычным автором - только когда их стало меньше
+FEED_CELEBRITY_DEMOTE_FOLLOWERS, и не в запросе, а командой
+demote_celebrities: его посты раскладываются всем подписчикам.
+"""
+import heapq
+import logging
+from itertools import islice
+from operator import attrgetter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, Max
+
+from .models import Follow, Post, TimelineEntry, UserStats
+
+FAN_OUT_BATCH_SIZE = 500
+FAN_OUT_STATS_KEYS = {
+    'posts': 'feed:fan_out:posts',
+    'rows': 'feed:fan_out:rows',
+    'max_rows': 'feed:fan_out:max_rows',
+    'skipped': 'feed:fan_out:skipped',
+}
+
+logger = logging.getLogger(__name__)
+
+
+def is_celebrity(author_id):
+    """Автор, посты которого подмешиваются в ленту при чтении"""
+    return UserStats.objects.filter(
+        user_id=author_id, celebrity=True
+    ).exists()
+
+
+def celebrity_authors(user):
+    """id авторов-знаменитостей среди подписок пользователя"""
+    return list(
+        Follow.objects.filter(
+            user=user,
+            author__stats__celebrity=True,
+        ).values_list('author_id', flat=True)
+    )
+
+
+def promote_celebrity(author_id):
+    """Делает автора знаменитостью, если подписчиков стало не меньше
+    FEED_CELEBRITY_FOLLOWERS. Записи ленты не трогаются: посты
+    знаменитости исключаются из них при чтении
+    """
+    UserStats.objects.filter(
+        user_id=author_id,
+        celebrity=False,
+        followers_count__gte=settings.FEED_CELEBRITY_FOLLOWERS,
+    ).update(celebrity=True)
+
+
+def _count_stat(name, delta=1):
+    key = FAN_OUT_STATS_KEYS[name]
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        pass
+
+
+def _record_fan_out(post, rows):
+    logger.info('post %s: fan-out to %s timelines', post.pk, rows)
+    _count_stat('posts')
+    _count_stat('rows', rows)
+    if rows > cache.get(FAN_OUT_STATS_KEYS['max_rows'], 0):
+        cache.set(FAN_OUT_STATS_KEYS['max_rows'], rows, None)
+
+
+def fan_out_stats():
+    """Метрики раскладки постов по лентам: сколько постов разложено,
+    сколько записей ленты создано (в среднем и максимум на пост) и сколько
+    постов знаменитостей оставлено для чтения при запросе
+    """
+    stats = {
+        name: cache.get(key, 0) for name, key in FAN_OUT_STATS_KEYS.items()
+    }
+    stats['avg_rows'] = (
+        stats['rows'] / stats['posts'] if stats['posts'] else 0
+    )
+    return stats
+
+
+def _insert_entries(entries):
+    """Вставляет записи ленты пачками по FAN_OUT_BATCH_SIZE, не собирая
+    в памяти все сразу (bulk_create сначала превращает их в список)
+    """
+    entries = iter(entries)
+    while True:
+        batch = list(islice(entries, FAN_OUT_BATCH_SIZE))
+        if not batch:
+            return
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def fan_out_post(post):
+    """Добавляет пост в ленты всех подписчиков автора, если автор
+    не знаменитость
+    """
+    if is_celebrity(post.author_id):
+        logger.info('post %s: fan-out skipped, celebrity author', post.pk)
+        _count_stat('skipped')
+        return
+    followers = list(Follow.objects.filter(
+        author_id=post.author_id
+    ).values_list('user_id', flat=True))
+    _insert_entries(
+        TimelineEntry(user_id=user_id, post=post, pub_date=post.pub_date)
+        for user_id in followers
+    )
+    _record_fan_out(post, len(followers))
+
+
+def backfill_timeline(user_id, author_id):
+    """Добавляет в ленту подписчика все посты автора"""
+    if is_celebrity(author_id):
+        return
+    posts = Post.objects.filter(
+        author_id=author_id
+    ).values_list('pk', 'pub_date')
+    _insert_entries(
+        TimelineEntry(user_id=user_id, post_id=pk, pub_date=pub_date)
+        for pk, pub_date in posts.iterator()
+    )
+
+
+def remove_from_timeline(user_id, author_id):
+    """Убирает из ленты подписчика посты автора"""
+    TimelineEntry.objects.filter(
+        user_id=user_id,
+        post__author_id=author_id,
+    ).delete()
+
+
+def _backfill(follows, posts):
+    """Раскладывает посты posts подписчикам из follows"""
+    rows = list(posts.values_list('pk', 'pub_date'))
+    if not rows:
+        return
+    _insert_entries(
+        TimelineEntry(user_id=user_id, post_id=pk, pub_date=pub_date)
+        for user_id in follows.values_list('user_id', flat=True).iterator()
+        for pk, pub_date in rows
+    )
+
+
+def demote_celebrity(author_id):
+    """Возвращает автора к раскладке постов по лентам: раскладывает его
+    посты подписчикам и снимает статус знаменитости, если подписчиков
+    по-прежнему меньше FEED_CELEBRITY_DEMOTE_FOLLOWERS. Посты и подписки,
+    появившиеся во время раскладки, раскладываются вторым проходом, а
+    записи подписчиков, отписавшихся за это время, удаляются.
+    Возвращает True, если статус снят
+    """
+    follows = Follow.objects.filter(author_id=author_id)
+    posts = Post.objects.filter(author_id=author_id)
+    last_follow = follows.aggregate(last=Max('pk'))['last'] or 0
+    last_post = posts.aggregate(last=Max('pk'))['last'] or 0
+    _backfill(follows, posts)
+    demoted = UserStats.objects.filter(
+        user_id=author_id,
+        celebrity=True,
+        followers_count__lt=settings.FEED_CELEBRITY_DEMOTE_FOLLOWERS,
+    ).update(celebrity=False)
+    if demoted:
+        _backfill(follows, posts.filter(pk__gt=last_post))
+        _backfill(follows.filter(pk__gt=last_follow), posts)
+    # отписка могла удалить записи ленты раньше, чем их вставила
+    # раскладка по списку подписчиков, прочитанному до нее
+    TimelineEntry.objects.filter(post__author_id=author_id).exclude(
+        user_id__in=follows.values('user_id')
+    ).delete()
+    return bool(demoted)
+
+
+def demote_celebrities():
+    """Снимает статус со всех знаменитостей, у которых подписчиков стало
+    меньше FEED_CELEBRITY_DEMOTE_FOLLOWERS. Возвращает их id
+    """
+    candidates = list(UserStats.objects.filter(
+        celebrity=True,
+        followers_count__lt=settings.FEED_CELEBRITY_DEMOTE_FOLLOWERS,
+    ).values_list('user_id', flat=True))
+    return [
+        author_id for author_id in candidates if demote_celebrity(author_id)
+    ]
+
+
+class HybridFeed:
+    """Лента из нескольких упорядоченных querysets, слитых по ключу
+    сортировки (k-way merge). Поддерживает то, что нужно пагинаторам:
+    count(), срезы, filter(), order_by() и select_related()
+    """
+    ordered = True
+
+    def __init__(self, *sources, ordering=('-pub_date', '-pk')):
+        self.ordering = ordering
+        self.sources = [source.order_by(*ordering) for source in sources]
+        self._key = attrgetter(*(field.lstrip('-') for field in ordering))
+        self._reverse = ordering[0].startswith('-')
+
+    def _clone(self, method, *args, **kwargs):
+        sources = [
+            getattr(source, method)(*args, **kwargs)
+            for source in self.sources
+        ]
+        return HybridFeed(*sources, ordering=self.ordering)
+
+    def filter(self, *args, **kwargs):
+        return self._clone('filter', *args, **kwargs)
+
+    def select_related(self, *fields):
+        return self._clone('select_related', *fields)
+
+    def order_by(self, *ordering):
+        return HybridFeed(*self.sources, ordering=ordering)
+
+    def count(self):
+        return sum(source.count() for source in self.sources)
+
+    def _merge(self, stop):
+        return heapq.merge(
+            *(source[:stop] for source in self.sources),
+            key=self._key,
+            reverse=self._reverse,
+        )
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            if item.stop is None:
+                raise ValueError('HybridFeed supports bounded slices only')
+            start = item.start or 0
+            return list(islice(self._merge(item.stop), start, item.stop))
+        return list(islice(self._merge(item + 1), item, item + 1))[0]
+
+
+def timeline_posts(user):
+    """Посты ленты подписок пользователя: разложенные записи ленты и
+    посты знаменитостей, на которых он подписан
+    """
+    celebrities = celebrity_authors(user)
+    pushed = Post.objects.filter(timeline_entries__user=user)
+    if not celebrities:
+        # F() - сортировка по самому столбцу post_id, иначе Django
+        # подставит Post.Meta.ordering и сортировка не пойдет по индексу
+        return pushed.order_by(
+            '-timeline_entries__pub_date',
+            F('timeline_entries__post').desc(),
+        )
+    pulled = Post.objects.filter(author_id__in=celebrities)
+    return HybridFeed(
+        pushed.exclude(author_id__in=celebrities),
+        pulled,
+    )
@@ -1,5 +1,7 @@
 from django import forms
+from django.core.files.uploadedfile import UploadedFile
 
+from .images import normalize_image
 from .models import Comment, Post
 
 
@@ -17,6 +19,38 @@ class PostForm(forms.ModelForm):
             'group': 'Группа, к которой будет относиться пост',
         }
 
+    def clean_image(self):
+        """Новая картинка сохраняется уменьшенной, без метаданных
+        (posts.images.normalize_image), ее размеры - в полях поста
+        """
+        image = self.cleaned_data.get('image')
+        if isinstance(image, UploadedFile):
+            return normalize_image(image)
+        return image
+
+    def save(self, commit=True):
+        """Новая картинка ставится в очередь на генерацию миниатюр, как
+        только пост сохранен (при commit=False - при post.save())
+        """
+        post = super().save(commit=False)
+        post.thumbnails_pending = 'image' in self.changed_data
+        if post.thumbnails_pending:
+            image = self.cleaned_data['image']
+            post.image_width = image.width if image else None
+            post.image_height = image.height if image else None
+        if commit:
+            post.save()
+            self._save_m2m()
+        return post
+
+
+class PostAdminForm(PostForm):
+    """Форма поста в админке: все поля модели, картинка нормализуется
+    так же, как в PostForm
+    """
+    class Meta(PostForm.Meta):
+        fields = '__all__'
+
 
 class CommentForm(forms.ModelForm):
     """Форма для создания комментария"""
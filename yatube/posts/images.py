@@ -0,0 +1,161 @@
+"""Обработка загруженных картинок постов.
+
+Оригинал не сохраняется как есть: normalize_image отклоняет картинки
+больше IMAGE_MAX_PIXELS (decompression bomb) еще до декодирования,
+поворачивает по EXIF-ориентации, уменьшает до IMAGE_MAX_SIZE и сохраняет
+progressive JPEG без метаданных. Миниатюры потом делаются из небольшого
+файла, а не из многомегабайтного снимка камеры.
+
+Картинки хранятся под именами по содержимому (posts.storage), один файл
+может принадлежать нескольким постам. Сигналы Post считают ссылки в
+MediaFile (acquire/release), cleanup_media удаляет файлы, на которые
+никто не ссылается дольше MEDIA_CLEANUP_GRACE секунд, вместе с
+их миниатюрами.
+"""
+import logging
+import os
+import warnings
+from datetime import timedelta
+from io import BytesIO
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation, ValidationError
+from django.core.files.images import ImageFile
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from PIL import Image, ImageOps
+from sorl.thumbnail import default
+
+from .models import MediaFile, Post
+from .thumbnails import source_image
+
+JPEG_BACKGROUND = (255, 255, 255)
+
+logger = logging.getLogger(__name__)
+
+
+def _open(file_):
+    """Открывает картинку, прочитав только заголовок"""
+    file_.seek(0)
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', Image.DecompressionBombWarning)
+        try:
+            return Image.open(file_)
+        except (Image.DecompressionBombError,
+                Image.DecompressionBombWarning):
+            raise ValidationError(
+                'Картинка слишком большая.', code='image_too_large'
+            )
+        except OSError:
+            raise ValidationError(
+                'Картинка повреждена или загружена не полностью.',
+                code='invalid_image',
+            )
+
+
+def _to_rgb(image):
+    """JPEG без прозрачности: прозрачные области - на белом фоне"""
+    if image.mode in ('RGBA', 'LA') or 'transparency' in image.info:
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, JPEG_BACKGROUND)
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def _encode(image):
+    """Декодирование картинки и сохранение в progressive JPEG"""
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail(settings.IMAGE_MAX_SIZE, Image.LANCZOS)
+    image = _to_rgb(image)
+    output = BytesIO()
+    image.save(
+        output,
+        format='JPEG',
+        quality=settings.IMAGE_JPEG_QUALITY,
+        optimize=True,
+        progressive=True,
+    )
+    output.seek(0)
+    return output
+
+
+def normalize_image(file_):
+    """Картинка file_ в виде progressive JPEG не больше IMAGE_MAX_SIZE
+    без метаданных (ImageFile с именем *.jpg, размеры - width и height).
+    У анимированных картинок остается первый кадр. Поврежденная или
+    обрезанная картинка - ValidationError
+    """
+    image = _open(file_)
+    width, height = image.size
+    if width * height > settings.IMAGE_MAX_PIXELS:
+        raise ValidationError(
+            'Картинка слишком большая: не больше %(max)s мегапикселей.',
+            code='image_too_large',
+            params={'max': settings.IMAGE_MAX_PIXELS // 1000000},
+        )
+    try:
+        output = _encode(image)
+    except (OSError, Image.DecompressionBombError, ValueError):
+        raise ValidationError(
+            'Картинка повреждена или загружена не полностью.',
+            code='invalid_image',
+        )
+    name = os.path.splitext(os.path.basename(file_.name))[0] + '.jpg'
+    return ImageFile(output, name=name)
+
+
+def acquire(name):
+    """Новая ссылка поста на файл картинки"""
+    _, created = MediaFile.objects.get_or_create(
+        name=name, defaults={'refs': 1}
+    )
+    if not created:
+        MediaFile.objects.filter(name=name).update(
+            refs=F('refs') + 1, released=None
+        )
+
+
+def release(name):
+    """Пост больше не ссылается на файл картинки. Файл остается в
+    хранилище до cleanup_media
+    """
+    MediaFile.objects.filter(name=name).update(
+        refs=Greatest(F('refs') - 1, 0)
+    )
+    MediaFile.objects.filter(name=name, refs=0, released=None).update(
+        released=timezone.now()
+    )
+
+
+def cleanup_media(grace=None):
+    """Удаляет файлы картинок без ссылок (и их миниатюры), освобожденные
+    больше grace секунд назад. Файл, на который все же ссылаются посты
+    (счетчик разошелся), не удаляется, счетчик исправляется.
+    Возвращает количество удаленных файлов
+    """
+    if grace is None:
+        grace = settings.MEDIA_CLEANUP_GRACE
+    cutoff = timezone.now() - timedelta(seconds=grace)
+    names = MediaFile.objects.filter(
+        refs=0, released__lt=cutoff
+    ).values_list('name', flat=True)
+    removed = 0
+    for name in list(names):
+        refs = Post.objects.filter(image=name).count()
+        if refs:
+            MediaFile.objects.filter(name=name).update(
+                refs=refs, released=None
+            )
+            continue
+        deleted, _ = MediaFile.objects.filter(name=name, refs=0).delete()
+        if not deleted:
+            continue
+        try:
+            default.backend.delete(source_image(name))
+        except (OSError, SuspiciousFileOperation):
+            logger.exception('media file %s: cleanup failed', name)
+            continue
+        removed += 1
+    return removed
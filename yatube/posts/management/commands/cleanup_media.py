@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from posts.images import cleanup_media
+
+
+class Command(BaseCommand):
+    help = ('Удаление файлов картинок, на которые не ссылается ни один '
+            'пост, вместе с их миниатюрами')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace',
+            type=int,
+            default=settings.MEDIA_CLEANUP_GRACE,
+            help='сколько секунд файл должен пробыть без ссылок',
+        )
+
+    def handle(self, *args, **options):
+        removed = cleanup_media(options['grace'])
+        self.stdout.write(f'Удалено файлов: {removed}')
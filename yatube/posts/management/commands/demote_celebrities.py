@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from posts.feed import demote_celebrities
+
+
+class Command(BaseCommand):
+    help = ('Возвращает к раскладке по лентам посты знаменитостей, у которых '
+            'подписчиков стало меньше FEED_CELEBRITY_DEMOTE_FOLLOWERS')
+
+    def handle(self, *args, **options):
+        demoted = demote_celebrities()
+        self.stdout.write(f'Снят статус знаменитости: {len(demoted)}')
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from posts.feed import fan_out_stats
+
+
+class Command(BaseCommand):
+    help = 'Метрики раскладки постов по лентам подписчиков (fan-out)'
+
+    def handle(self, *args, **options):
+        stats = fan_out_stats()
+        self.stdout.write(
+            f'Разложено постов: {stats["posts"]}\n'
+            f'Создано записей лент: {stats["rows"]}\n'
+            f'В среднем на пост: {stats["avg_rows"]:.1f}\n'
+            f'Максимум на пост: {stats["max_rows"]}\n'
+            f'Посты знаменитостей (без раскладки): {stats["skipped"]}'
+        )
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from posts.counters import rebuild_counters
+
+
+class Command(BaseCommand):
+    help = ('Пересчет счетчиков постов, комментариев, подписчиков '
+            'и подписок')
+
+    def handle(self, *args, **options):
+        users_fixed, posts_fixed = rebuild_counters()
+        self.stdout.write(
+            f'Исправлено счетчиков пользователей: {users_fixed}\n'
+            f'Исправлено счетчиков комментариев: {posts_fixed}'
+        )
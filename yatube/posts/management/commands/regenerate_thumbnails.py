@@ -0,0 +1,165 @@
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from datetime import date
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.models import Post
+from posts.thumbnails import regenerate_thumbnails
+
+
+def regenerate(name, force):
+    """Задача процесса пула: (имя, количество миниатюр, ошибка)"""
+    try:
+        return name, regenerate_thumbnails(name, force), None
+    except Exception as error:
+        return name, 0, f'{type(error).__name__}: {error}'
+
+
+class Command(BaseCommand):
+    help = ('Создание миниатюр всех размеров для картинок постов в пуле '
+            'процессов. Прогресс сохраняется: повторный запуск с теми же '
+            'фильтрами продолжается с места остановки')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(),
+            help='количество процессов; 0 - без пула, в этом процессе',
+        )
+        parser.add_argument(
+            '--since', type=date.fromisoformat,
+            help='посты, опубликованные с даты (ГГГГ-ММ-ДД)',
+        )
+        parser.add_argument(
+            '--until', type=date.fromisoformat,
+            help='посты, опубликованные по дату включительно (ГГГГ-ММ-ДД)',
+        )
+        parser.add_argument('--group', help='slug группы')
+        parser.add_argument(
+            '--force', action='store_true',
+            help='удалить и создать заново уже созданные миниатюры',
+        )
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument(
+            '--state',
+            default=os.path.join(
+                settings.MEDIA_ROOT, 'cache', 'regenerate_thumbnails.json'
+            ),
+            help='файл с прогрессом',
+        )
+        parser.add_argument(
+            '--restart', action='store_true',
+            help='начать сначала, не учитывая сохраненный прогресс',
+        )
+
+    def posts(self, options):
+        posts = Post.objects.exclude(image='').exclude(image=None)
+        if options['since']:
+            posts = posts.filter(pub_date__date__gte=options['since'])
+        if options['until']:
+            posts = posts.filter(pub_date__date__lte=options['until'])
+        if options['group']:
+            posts = posts.filter(group__slug=options['group'])
+        return posts.order_by('pk')
+
+    def load_state(self, path, run):
+        try:
+            with open(path) as file:
+                state = json.load(file)
+        except (OSError, ValueError):
+            return None
+        return state if state.get('run') == run else None
+
+    def save_state(self, path, state):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = f'{path}.tmp'
+        with open(temporary, 'w') as file:
+            json.dump(state, file)
+        os.replace(temporary, path)
+
+    def batches(self, posts, size):
+        """Пачки (последний pk, количество постов, имена картинок)
+        без повторов файлов
+        """
+        seen = set()
+        batch = []
+        count = 0
+        for pk, name in posts.values_list('pk', 'image').iterator():
+            count += 1
+            if name not in seen:
+                seen.add(name)
+                batch.append(name)
+            if len(batch) == size:
+                yield pk, count, batch
+                batch = []
+                count = 0
+        if count:
+            yield pk, count, batch
+
+    def handle(self, *args, **options):
+        if options['workers'] < 0:
+            raise CommandError('--workers не может быть отрицательным')
+        run = {
+            key: str(options[key]) if options[key] else None
+            for key in ('since', 'until', 'group')
+        }
+        run['force'] = options['force']
+        state = None
+        if not options['restart']:
+            state = self.load_state(options['state'], run)
+        if state is None:
+            state = {'run': run, 'last_pk': 0, 'images': 0, 'errors': 0}
+        else:
+            self.stdout.write(
+                f'Продолжение после поста {state["last_pk"]}: '
+                f'уже обработано картинок {state["images"]}'
+            )
+        posts = self.posts(options).filter(pk__gt=state['last_pk'])
+        total = posts.count()
+        processed = images = 0
+        started = time.monotonic()
+        workers = options['workers']
+        # spawn, а не fork: процессам пула не должны достаться открытые
+        # подключения к БД (SQLite) этого процесса
+        pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=django.setup,
+        ) if workers else nullcontext()
+        with pool:
+            batches = self.batches(posts, options['batch_size'])
+            for last_pk, count, names in batches:
+                forces = [options['force']] * len(names)
+                if workers:
+                    results = pool.map(
+                        regenerate, names, forces,
+                        chunksize=max(1, len(names) // workers),
+                    )
+                else:
+                    results = map(regenerate, names, forces)
+                for name, _, error in results:
+                    if error:
+                        state['errors'] += 1
+                        self.stderr.write(f'{name}: {error}')
+                state['images'] += len(names)
+                state['last_pk'] = last_pk
+                self.save_state(options['state'], state)
+                processed += count
+                images += len(names)
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    f'постов {processed}/{total}, картинок {images}: '
+                    f'{images / elapsed:.1f} картинок/с'
+                )
+        elapsed = time.monotonic() - started
+        rate = images / elapsed if elapsed else 0
+        self.stdout.write(
+            f'Готово: картинок {state["images"]}, ошибок {state["errors"]}, '
+            f'{rate:.1f} картинок/с'
+        )
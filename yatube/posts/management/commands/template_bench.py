@@ -0,0 +1,70 @@
+import time
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.template import engines
+from django.template.loader import render_to_string
+from django.test import RequestFactory
+from django.test.utils import override_settings
+from django.urls import resolve
+
+from posts.models import Post
+from posts.utils import paginator
+
+# шаблоны, которые рендерятся напрямую (render, render_to_string);
+# остальные подключаются из них через include
+FEED_TEMPLATES = [
+    'posts/index.html',
+    'posts/includes/post_card.html',
+]
+
+
+class Command(BaseCommand):
+    help = ('Время рендеринга главной страницы с постами шаблонами Django '
+            'и Jinja2. Карточки постов рендерятся каждый раз, без кэша')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=10)
+        parser.add_argument('--repeat', type=int, default=50)
+
+    def context(self, count):
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        request.resolver_match = resolve('/')
+        page_obj = paginator(
+            request,
+            Post.objects.select_related('author', 'group').all(),
+            count,
+            keyset=False,
+        )
+        list(page_obj)
+        return request, {'index': True, 'follow': False, 'page_obj': page_obj}
+
+    def measure(self, count, repeat, jinja2_templates):
+        request, context = self.context(count)
+        with override_settings(
+            JINJA2_TEMPLATES=jinja2_templates, POST_CARD_CACHE_TIMEOUT=0
+        ):
+            render_to_string('posts/index.html', context, request)
+            started = time.perf_counter()
+            for _ in range(repeat):
+                render_to_string('posts/index.html', context, request)
+            elapsed = time.perf_counter() - started
+        return elapsed / repeat * 1000
+
+    def handle(self, *args, **options):
+        if 'jinja2' not in engines:
+            raise CommandError('Jinja2 не установлен')
+        count = options['posts']
+        if Post.objects.count() < count:
+            raise CommandError(f'Нужно хотя бы {count} постов')
+        results = {
+            'Django': self.measure(count, options['repeat'], []),
+            'Jinja2': self.measure(count, options['repeat'], FEED_TEMPLATES),
+        }
+        for engine, ms in results.items():
+            self.stdout.write(f'{engine}: {ms:.2f} мс на страницу')
+        self.stdout.write(
+            f'Jinja2 быстрее в {results["Django"] / results["Jinja2"]:.2f} '
+            f'раза'
+        )
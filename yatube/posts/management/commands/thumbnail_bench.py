@@ -0,0 +1,74 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.template.loader import render_to_string
+from django.test.utils import CaptureQueriesContext
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import settings as thumbnail_settings
+
+from posts.models import Post
+from posts.thumbnails import prefetch_thumbnails
+
+
+class Command(BaseCommand):
+    help = ('Время рендеринга карточек постов с картинками: поштучные '
+            'обращения к KV-хранилищу миниатюр против prefetch_thumbnails, '
+            'с холодным и прогретым кэшем хранилища')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=10)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def posts(self, count):
+        return list(
+            Post.objects.select_related('author', 'group').exclude(
+                image=''
+            ).exclude(image=None)[:count]
+        )
+
+    def clear_kvstore_cache(self):
+        """Холодный кэш: убираем из кэша все записи KV-хранилища sorl"""
+        keys = default.kvstore._find_keys_raw(
+            thumbnail_settings.THUMBNAIL_KEY_PREFIX
+        )
+        default.kvstore.cache.delete_many(list(keys))
+
+    def render(self, posts, prefetch):
+        if prefetch:
+            prefetch_thumbnails(posts)
+        for post in posts:
+            render_to_string(
+                'posts/includes/post_card.html',
+                {'post': post, 'show_author': True},
+            )
+
+    def measure(self, count, repeat, prefetch, cold):
+        elapsed = 0
+        queries = 0
+        for _ in range(repeat):
+            posts = self.posts(count)
+            if cold:
+                self.clear_kvstore_cache()
+            with CaptureQueriesContext(connection) as context:
+                started = time.perf_counter()
+                self.render(posts, prefetch)
+                elapsed += time.perf_counter() - started
+            queries += len(context.captured_queries)
+        return elapsed / repeat * 1000, queries / repeat
+
+    def handle(self, *args, **options):
+        count = options['posts']
+        if not self.posts(count):
+            raise CommandError('Нет постов с картинками')
+        self.render(self.posts(count), prefetch=False)
+        for cold in (True, False):
+            for prefetch in (False, True):
+                ms, queries = self.measure(
+                    count, options['repeat'], prefetch, cold
+                )
+                self.stdout.write(
+                    f'{"холодный" if cold else "прогретый"} кэш, '
+                    f'{"prefetch" if prefetch else "поштучно"}: '
+                    f'{ms:.1f} мс, {queries:.1f} запросов к БД на страницу'
+                )
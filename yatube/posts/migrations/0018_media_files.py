@@ -0,0 +1,52 @@
+# Generated by Django 2.2.16 on 2026-10-17 21:30
+
+from django.db import migrations, models
+import posts.storage
+
+
+def fill_media_files(apps, schema_editor):
+    """Счетчики ссылок на уже загруженные картинки"""
+    Post = apps.get_model('posts', 'Post')
+    MediaFile = apps.get_model('posts', 'MediaFile')
+    images = Post.objects.exclude(image='').exclude(image=None).values(
+        'image'
+    ).annotate(refs=models.Count('pk')).order_by()
+    MediaFile.objects.bulk_create(
+        (
+            MediaFile(name=row['image'], refs=row['refs'])
+            for row in images.iterator()
+        ),
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0017_image_dimensions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaFile',
+            fields=[
+                ('name', models.CharField(max_length=100, primary_key=True, serialize=False, verbose_name='Имя файла')),
+                ('refs', models.PositiveIntegerField(default=0, verbose_name='Количество ссылок')),
+                ('released', models.DateTimeField(blank=True, null=True, verbose_name='Время удаления последней ссылки')),
+            ],
+            options={
+                'verbose_name': 'Файл картинки',
+                'verbose_name_plural': 'Файлы картинок',
+            },
+        ),
+        # хранилище не влияет на схему: без этого SQLite пересоздал бы
+        # таблицу posts_post (и удалил бы триггеры индекса поиска)
+        migrations.SeparateDatabaseAndState(state_operations=[
+            migrations.AlterField(
+                model_name='post',
+                name='image',
+                field=models.ImageField(blank=True, help_text='Загрузите картинку для вашего поста', null=True, storage=posts.storage.ContentHashStorage(), upload_to='posts/', verbose_name='Картинка'),
+            ),
+        ]),
+        migrations.RunPython(fill_media_files, migrations.RunPython.noop),
+    ]
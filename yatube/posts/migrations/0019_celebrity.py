@@ -0,0 +1,28 @@
+# Generated by Django 2.2.16 on 2026-10-17 22:01
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_celebrity(apps, schema_editor):
+    """Знаменитости - авторы, у которых подписчиков не меньше порога"""
+    UserStats = apps.get_model('posts', 'UserStats')
+    UserStats.objects.filter(
+        followers_count__gte=settings.FEED_CELEBRITY_FOLLOWERS
+    ).update(celebrity=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0018_media_files'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userstats',
+            name='celebrity',
+            field=models.BooleanField(default=False, help_text='Посты не раскладываются по лентам подписчиков', verbose_name='Знаменитость'),
+        ),
+        migrations.RunPython(fill_celebrity, migrations.RunPython.noop),
+    ]
@@ -3,6 +3,7 @@ from django.db import models
 
 from yatube.settings import (CHAR_NUM_OBJECT_NAME_COMMENT,
                              CHAR_NUM_OBJECT_NAME_POST)
+from .storage import ContentHashStorage
 
 User = get_user_model()
 
@@ -48,16 +49,45 @@ class Post(models.Model):
     )
     image = models.ImageField(
         upload_to='posts/',
+        storage=ContentHashStorage(),
         blank=True,
         null=True,
         verbose_name='Картинка',
         help_text='Загрузите картинку для вашего поста',
     )
+    image_width = models.PositiveIntegerField(
+        verbose_name='Ширина картинки',
+        blank=True,
+        null=True,
+        editable=False,
+    )
+    image_height = models.PositiveIntegerField(
+        verbose_name='Высота картинки',
+        blank=True,
+        null=True,
+        editable=False,
+    )
+    comments_count = models.PositiveIntegerField(
+        verbose_name='Количество комментариев',
+        default=0,
+        editable=False,
+    )
 
     class Meta:
         ordering = ['-pub_date']
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='post_date_idx'),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='post_author_date_idx'),
+            models.Index(
+                fields=['group', '-pub_date', '-id'],
+                name='post_group_date_idx'),
+        ]
 
     def __str__(self):
         return self.text[:CHAR_NUM_OBJECT_NAME_POST]
@@ -91,6 +121,11 @@ class Comment(models.Model):
         ordering = ['-created']
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
+        indexes = [
+            models.Index(
+                fields=['post', '-created', '-id'],
+                name='comment_post_created_idx'),
+        ]
 
     def __str__(self):
         return self.text[:CHAR_NUM_OBJECT_NAME_COMMENT]
@@ -122,6 +157,113 @@ class Follow(models.Model):
                 fields=['user', 'author'],
                 name='unique_follow'),
         ]
+        indexes = [
+            models.Index(
+                fields=['author', 'user'],
+                name='follow_author_user_idx'),
+        ]
 
     def __str__(self):
         return f'Автор: {self.author} - подписчик {self.user}'
+
+
+class TimelineEntry(models.Model):
+    """Модель ленты подписок: пост автора в ленте подписчика.
+    Заполняется при публикации поста и при подписке (fan-out on write)
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Подписчик',
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Пост',
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации поста',
+    )
+
+    class Meta:
+        verbose_name = 'Запись ленты подписок'
+        verbose_name_plural = 'Записи ленты подписок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'],
+                name='unique_timeline_post'),
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-post'],
+                name='timeline_user_date_idx'),
+        ]
+
+    def __str__(self):
+        return f'Подписчик: {self.user_id} - пост {self.post_id}'
+
+
+class UserStats(models.Model):
+    """Модель счетчиков пользователя: посты, подписчики, подписки.
+    Поддерживается сигналами, пересчитывается командой rebuild_counters
+    """
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='Пользователь',
+    )
+    posts_count = models.PositiveIntegerField(
+        verbose_name='Количество постов',
+        default=0,
+    )
+    followers_count = models.PositiveIntegerField(
+        verbose_name='Количество подписчиков',
+        default=0,
+    )
+    following_count = models.PositiveIntegerField(
+        verbose_name='Количество подписок',
+        default=0,
+    )
+    celebrity = models.BooleanField(
+        verbose_name='Знаменитость',
+        default=False,
+        help_text='Посты не раскладываются по лентам подписчиков',
+    )
+
+    class Meta:
+        verbose_name = 'Счетчики пользователя'
+        verbose_name_plural = 'Счетчики пользователей'
+
+    def __str__(self):
+        return f'Счетчики пользователя {self.user_id}'
+
+
+class MediaFile(models.Model):
+    """Файл картинки в хранилище и количество постов, которые на него
+    ссылаются. Файлы без ссылок удаляет команда cleanup_media
+    """
+    name = models.CharField(
+        verbose_name='Имя файла',
+        max_length=100,
+        primary_key=True,
+    )
+    refs = models.PositiveIntegerField(
+        verbose_name='Количество ссылок',
+        default=0,
+    )
+    released = models.DateTimeField(
+        verbose_name='Время удаления последней ссылки',
+        blank=True,
+        null=True,
+    )
+
+    class Meta:
+        verbose_name = 'Файл картинки'
+        verbose_name_plural = 'Файлы картинок'
+
+    def __str__(self):
+        return f'{self.name} ({self.refs})'
@@ -0,0 +1,188 @@
+"""Полнотекстовый поиск по постам (SQLite FTS5).
+
+Таблица posts_post_fts (создается миграцией 0015) - внешний индекс
+по posts_post.text: строки индекса - это id постов, текст хранится
+только в posts_post. Индекс поддерживается триггерами БД, поэтому
+bulk_create и update() его тоже обновляют. SQLite удаляет триггеры,
+когда пересоздает posts_post при изменении схемы, поэтому после каждой
+миграции недостающие триггеры создаются заново, а индекс
+перестраивается (restore_index). Результаты упорядочены по
+релевантности bm25 и листаются курсором по (релевантность, id).
+
+На других СУБД индекса нет, поиск выполняется через icontains.
+"""
+import math
+import re
+
+from django.db import DEFAULT_DB_ALIAS, connection, connections, router
+from django.db.migrations.recorder import MigrationRecorder
+from django.db.models.expressions import RawSQL
+from django.utils.encoding import force_bytes, force_text
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+
+from .models import Post
+from .utils import MAX_PK
+
+FTS_TABLE = 'posts_post_fts'
+# миграция, создающая индекс
+FTS_MIGRATION = ('posts', '0015_post_search')
+FTS_TRIGGERS = (
+    'posts_post_fts_insert',
+    'posts_post_fts_delete',
+    'posts_post_fts_update',
+)
+
+CREATE_SQL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    "text, content='posts_post', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS posts_post_fts_insert "
+    "AFTER INSERT ON posts_post BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, text) VALUES (new.id, new.text); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS posts_post_fts_delete "
+    "AFTER DELETE ON posts_post BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text) "
+    "VALUES ('delete', old.id, old.text); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS posts_post_fts_update "
+    "AFTER UPDATE OF text ON posts_post BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text) "
+    "VALUES ('delete', old.id, old.text); "
+    f"INSERT INTO {FTS_TABLE}(rowid, text) VALUES (new.id, new.text); "
+    "END",
+)
+
+WORD_RE = re.compile(r'\w+')
+
+
+def fts_available(using=connection):
+    return using.vendor == 'sqlite'
+
+
+def rebuild_index(using=connection):
+    """Заново строит индекс по posts_post и уплотняет его"""
+    with using.cursor() as cursor:
+        for sql in CREATE_SQL:
+            cursor.execute(sql)
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"
+        )
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')"
+        )
+
+
+def restore_index(using=DEFAULT_DB_ALIAS, **kwargs):
+    """Обработчик post_migrate: если индекс создан миграцией, но его
+    таблицы или триггеров нет, создает их и перестраивает индекс -
+    изменения постов, сделанные без триггеров, в нем не отражены
+    """
+    database = connections[using]
+    if (
+        not fts_available(database)
+        or not router.allow_migrate(using, 'posts')
+        or FTS_MIGRATION
+        not in MigrationRecorder(database).applied_migrations()
+    ):
+        return
+    with database.cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE name IN (%s, %s, %s, %s)",
+            [FTS_TABLE, *FTS_TRIGGERS],
+        )
+        existing = {name for name, in cursor.fetchall()}
+    if existing != {FTS_TABLE, *FTS_TRIGGERS}:
+        rebuild_index(database)
+
+
+def match_expression(query):
+    """Запрос пользователя в выражение MATCH: все слова обязательны,
+    последнее ищется как префикс. Синтаксис FTS5 из запроса не
+    используется, поэтому ошибок разбора не бывает
+    """
+    words = WORD_RE.findall(query)
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def matching_ids(expression):
+    """Подзапрос id постов, подходящих под выражение MATCH (для pk__in)"""
+    return RawSQL(
+        f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+        (expression,),
+    )
+
+
+def encode_cursor(rank, pk):
+    return urlsafe_base64_encode(force_bytes(f'{rank!r}|{pk}'))
+
+
+def decode_cursor(cursor):
+    """(релевантность, id) или None, если курсор поврежден"""
+    try:
+        rank, pk = force_text(urlsafe_base64_decode(cursor)).split('|')
+        rank, pk = float(rank), int(pk)
+    except (TypeError, ValueError, UnicodeDecodeError):
+        return None
+    if not math.isfinite(rank) or not 0 < pk <= MAX_PK:
+        return None
+    return rank, pk
+
+
+class SearchPage(list):
+    """Страница результатов поиска с курсором на следующую страницу"""
+    is_cursor = True
+
+    def __init__(self, posts, next_cursor):
+        super().__init__(posts)
+        self.next_cursor = next_cursor
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+def _ranked_ids(expression, after, limit):
+    sql = (
+        f'SELECT rowid, bm25({FTS_TABLE}) AS score FROM {FTS_TABLE} '
+        f'WHERE {FTS_TABLE} MATCH %s'
+    )
+    params = [expression]
+    if after is not None:
+        rank, pk = after
+        sql += ' AND (score > %s OR (score = %s AND rowid > %s))'
+        params += [rank, rank, pk]
+    sql += ' ORDER BY score, rowid LIMIT %s'
+    params.append(limit)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def search_posts(query, per_page, cursor=None, queryset=None):
+    """Страница постов по запросу, самые релевантные первыми"""
+    if queryset is None:
+        queryset = Post.objects.select_related('author', 'group')
+    after = decode_cursor(cursor) if cursor else None
+    expression = match_expression(query)
+    if expression is None:
+        return SearchPage([], None)
+    if not fts_available():
+        return SearchPage(
+            list(queryset.filter(text__icontains=query.strip())[:per_page]),
+            None,
+        )
+    rows = _ranked_ids(expression, after, per_page + 1)
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        pk, score = rows[-1]
+        next_cursor = encode_cursor(score, pk)
+    posts = queryset.in_bulk([pk for pk, _ in rows])
+    return SearchPage(
+        [posts[pk] for pk, _ in rows if pk in posts],
+        next_cursor,
+    )
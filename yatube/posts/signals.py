@@ -0,0 +1,172 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from .cache import bump
+from .counters import change_comments_count, change_user_stat
+from .feed import (backfill_timeline, fan_out_post, promote_celebrity,
+                   remove_from_timeline)
+from .images import acquire, release
+from .models import Comment, Follow, Group, Post, UserStats
+from .thumbnails import enqueue_thumbnails
+from .utils import post_author_key, posts_count_key
+
+User = get_user_model()
+
+
+def _change_counts(keys, delta):
+    """Сдвигает закэшированные количества постов; отсутствующие ключи
+    пропускаются - они будут посчитаны заново при следующем обращении
+    """
+    for key in keys:
+        try:
+            cache.incr(key, delta)
+        except ValueError:
+            pass
+
+
+def _post_count_keys(author_id, group_id):
+    keys = [posts_count_key('all'), posts_count_key('author', author_id)]
+    if group_id is not None:
+        keys.append(posts_count_key('group', group_id))
+    return keys
+
+
+def _author_scope(author_id):
+    return f'author:{author_id}'
+
+
+def _group_scope(group_id):
+    slug = Group.objects.filter(pk=group_id).values_list(
+        'slug', flat=True
+    ).first()
+    return f'group:{slug}'
+
+
+def _bump_post_scopes(instance):
+    """Устаревают ленты: общая, автора, текущей и прежней группы поста"""
+    scopes = {
+        'posts',
+        _author_scope(instance.author_id),
+        f'card:post:{instance.pk}',
+    }
+    for group_id in (instance._initial_group_id, instance.group_id):
+        if group_id is not None:
+            scopes.add(_group_scope(group_id))
+    bump(*scopes)
+    cache.delete(post_author_key(instance.pk))
+
+
+def _image_name(instance):
+    """Имя файла картинки поста; None - поле не загружено (defer)"""
+    if 'image' not in instance.__dict__:
+        return None
+    image = instance.__dict__['image']
+    return getattr(image, 'name', image) or ''
+
+
+def _change_image_refs(old, new):
+    if old == new or old is None:
+        return
+    if new:
+        acquire(new)
+    if old:
+        release(old)
+
+
+@receiver(post_init, sender=Post)
+def remember_post_group(sender, instance, **kwargs):
+    """Запоминаем исходную группу поста, чтобы при смене группы
+    поправить счетчики обеих групп, и исходную картинку - для счетчика
+    ссылок на файл
+    """
+    instance._initial_group_id = instance.group_id
+    instance._initial_image = _image_name(instance)
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    if created:
+        _change_counts(
+            _post_count_keys(instance.author_id, instance.group_id), 1
+        )
+        change_user_stat(instance.author_id, 'posts_count', 1)
+        fan_out_post(instance)
+    elif instance._initial_group_id != instance.group_id:
+        if instance._initial_group_id is not None:
+            _change_counts(
+                [posts_count_key('group', instance._initial_group_id)], -1
+            )
+        if instance.group_id is not None:
+            _change_counts([posts_count_key('group', instance.group_id)], 1)
+    _bump_post_scopes(instance)
+    instance._initial_group_id = instance.group_id
+    image = _image_name(instance)
+    _change_image_refs('' if created else instance._initial_image, image)
+    instance._initial_image = image
+    if getattr(instance, 'thumbnails_pending', False):
+        instance.thumbnails_pending = False
+        enqueue_thumbnails(instance)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    _change_counts(
+        _post_count_keys(instance.author_id, instance.group_id), -1
+    )
+    change_user_stat(instance.author_id, 'posts_count', -1)
+    _bump_post_scopes(instance)
+    _change_image_refs(_image_name(instance), '')
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, **kwargs):
+    if created:
+        change_comments_count(instance.post_id, 1)
+    bump(f'comments:{instance.post_id}')
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    change_comments_count(instance.post_id, -1)
+    bump(f'comments:{instance.post_id}')
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, instance, **kwargs):
+    bump('groups', f'card:group:{instance.pk}')
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, update_fields=None, **kwargs):
+    """Обновление только last_login при входе ленты не меняет"""
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    bump('users', f'card:user:{instance.pk}')
+
+
+@receiver(post_save, sender=User)
+def create_user_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        UserStats.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=Follow)
+def follow_saved(sender, instance, created, **kwargs):
+    if created:
+        change_user_stat(instance.author_id, 'followers_count', 1)
+        change_user_stat(instance.user_id, 'following_count', 1)
+        promote_celebrity(instance.author_id)
+        backfill_timeline(instance.user_id, instance.author_id)
+    bump(_author_scope(instance.author_id))
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    change_user_stat(instance.author_id, 'followers_count', -1)
+    change_user_stat(instance.user_id, 'following_count', -1)
+    remove_from_timeline(instance.user_id, instance.author_id)
+    bump(_author_scope(instance.author_id))
@@ -0,0 +1,51 @@
+"""Хранилище картинок постов с именами по содержимому.
+
+Файл сохраняется под именем <каталог>/<sha256 содержимого><расширение>:
+одинаковые картинки получают одно имя, повторная загрузка не пишет файл
+заново, а миниатюры sorl (их имена зависят от имени исходного файла)
+создаются один раз. Поэтому один файл может принадлежать нескольким
+постам - ссылки на него считает MediaFile (posts.images).
+"""
+import hashlib
+import os
+import uuid
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+
+def content_hash(content):
+    """sha256 содержимого файла (файл читается по частям)"""
+    digest = hashlib.sha256()
+    for chunk in content.chunks():
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ContentHashStorage(FileSystemStorage):
+    def hashed_name(self, name, content):
+        directory, filename = os.path.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        return os.path.join(directory, content_hash(content) + extension)
+
+    def save(self, name, content, max_length=None):
+        """Сохраняет файл под именем по содержимому; если такой файл уже
+        есть, запись пропускается
+        """
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.hashed_name(name, content)
+        if self.exists(name):
+            return name
+        return self._save(name, content)
+
+    def _save(self, name, content):
+        """Файл пишется под временным именем и атомарно переименовывается:
+        параллельная загрузка той же картинки перезапишет его тем же
+        содержимым
+        """
+        temporary = super()._save(f'{name}.{uuid.uuid4().hex}.tmp', content)
+        os.replace(self.path(temporary), self.path(name))
+        return name
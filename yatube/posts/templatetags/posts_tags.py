@@ -0,0 +1,58 @@
+import logging
+
+from django import template
+from django.utils.safestring import mark_safe
+from sorl.thumbnail.conf import settings as thumbnail_settings
+
+from posts.cache import render_post_cards
+from posts.thumbnails import post_picture as get_post_picture
+from posts.thumbnails import post_thumbnail as get_post_thumbnail
+
+logger = logging.getLogger(__name__)
+
+register = template.Library()
+
+
+@register.filter
+def page_window(page_obj):
+    """Окно номеров страниц вокруг текущей страницы (для пагинатора)"""
+    return page_obj.paginator.get_elided_page_range(page_obj.number)
+
+
+@register.simple_tag
+def post_cards(posts, show_author=True):
+    """Карточки постов страницы из кэша фрагментов"""
+    return [
+        mark_safe(card) for card in render_post_cards(posts, show_author)
+    ]
+
+
+def _without_errors(get, post, geometry_string):
+    """Ошибки миниатюр, как и тег thumbnail sorl, пишутся в лог,
+    а пост выводится без картинки
+    """
+    try:
+        return get(post, geometry_string)
+    except Exception:
+        if thumbnail_settings.THUMBNAIL_DEBUG:
+            raise
+        logger.exception('post %s: thumbnail failed', post.pk)
+        return None
+
+
+@register.simple_tag
+def post_thumbnail(post, geometry_string):
+    """Миниатюра картинки поста размера из THUMBNAIL_GEOMETRIES
+    (с учетом prefetch_thumbnails)
+    """
+    return _without_errors(get_post_thumbnail, post, geometry_string)
+
+
+@register.inclusion_tag('posts/includes/post_picture.html')
+def post_picture(post, geometry_string):
+    """<picture> картинки поста: srcset вариантов размера
+    из THUMBNAIL_GEOMETRIES в форматах THUMBNAIL_SRCSET_FORMATS
+    """
+    return {
+        'picture': _without_errors(get_post_picture, post, geometry_string)
+    }
@@ -0,0 +1,72 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Post, UserStats
+
+User = get_user_model()
+
+
+class CountersTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author')
+        self.reader = User.objects.create_user(username='reader')
+        self.post = Post.objects.create(author=self.author, text='Пост')
+
+    def stats(self, user):
+        return UserStats.objects.get(user=user)
+
+    def test_counters_follow_create_and_delete(self):
+        """Счетчики меняются при создании и удалении постов, комментариев
+        и подписок
+        """
+        Post.objects.create(author=self.author, text='Второй пост')
+        comment = Comment.objects.create(
+            post=self.post, author=self.reader, text='Комментарий'
+        )
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.post.refresh_from_db()
+        self.assertEqual(self.stats(self.author).posts_count, 2)
+        self.assertEqual(self.stats(self.author).followers_count, 1)
+        self.assertEqual(self.stats(self.reader).following_count, 1)
+        self.assertEqual(self.post.comments_count, 1)
+        comment.delete()
+        Follow.objects.filter(user=self.reader).delete()
+        Post.objects.filter(text='Второй пост').delete()
+        self.post.refresh_from_db()
+        self.assertEqual(self.stats(self.author).posts_count, 1)
+        self.assertEqual(self.stats(self.author).followers_count, 0)
+        self.assertEqual(self.stats(self.reader).following_count, 0)
+        self.assertEqual(self.post.comments_count, 0)
+
+    def test_rebuild_counters(self):
+        """Команда rebuild_counters исправляет разошедшиеся счетчики"""
+        UserStats.objects.filter(user=self.author).update(posts_count=10)
+        UserStats.objects.filter(user=self.reader).delete()
+        Post.objects.filter(pk=self.post.pk).update(comments_count=3)
+        call_command('rebuild_counters', stdout=open('/dev/null', 'w'))
+        self.post.refresh_from_db()
+        self.assertEqual(self.stats(self.author).posts_count, 1)
+        self.assertEqual(self.stats(self.reader).following_count, 0)
+        self.assertEqual(self.post.comments_count, 0)
+
+    def test_pages_read_counters(self):
+        """Страницы показывают счетчики, а не считают строки заново"""
+        UserStats.objects.filter(user=self.author).update(
+            posts_count=7, followers_count=5
+        )
+        Post.objects.filter(pk=self.post.pk).update(comments_count=4)
+        client = Client()
+        response = client.get(
+            reverse('posts:profile', args=[self.author.username])
+        )
+        self.assertContains(response, 'Всего постов: 7')
+        self.assertContains(response, 'Подписчиков: 5')
+        response = client.get(
+            reverse('posts:post_detail', args=[self.post.pk])
+        )
+        self.assertContains(response, 'Всего постов автора: 7')
+        self.assertContains(response, 'Комментариев: 4')
@@ -0,0 +1,206 @@
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from posts import feed
+from posts.feed import (HybridFeed, fan_out_stats, is_celebrity,
+                        timeline_posts)
+from posts.models import Follow, Post, TimelineEntry
+
+User = get_user_model()
+
+
+class TimelineTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Author')
+        cls.follower = User.objects.create_user(username='Follower')
+        cls.old_post = Post.objects.create(
+            author=cls.author,
+            text='Пост до подписки',
+        )
+
+    def setUp(self):
+        self.follower_client = Client()
+        self.follower_client.force_login(self.follower)
+        cache.clear()
+
+    def timeline_post_ids(self):
+        return set(
+            TimelineEntry.objects.filter(
+                user=self.follower
+            ).values_list('post_id', flat=True)
+        )
+
+    def test_follow_backfills_timeline(self):
+        """Подписка добавляет в ленту уже опубликованные посты автора"""
+        self.follower_client.get(
+            reverse('posts:profile_follow',
+                    kwargs={'username': self.author.username})
+        )
+        self.assertEqual(self.timeline_post_ids(), {self.old_post.pk})
+
+    def test_new_post_fanned_out_to_followers(self):
+        """Новый пост попадает в ленты подписчиков с датой публикации"""
+        Follow.objects.create(user=self.follower, author=self.author)
+        new_post = Post.objects.create(author=self.author, text='Новый пост')
+        self.assertEqual(
+            self.timeline_post_ids(),
+            {self.old_post.pk, new_post.pk}
+        )
+        entry = TimelineEntry.objects.get(post=new_post)
+        self.assertEqual(entry.pub_date, new_post.pub_date)
+
+    def test_unfollow_clears_timeline(self):
+        """Отписка убирает посты автора из ленты подписчика"""
+        Follow.objects.create(user=self.follower, author=self.author)
+        self.follower_client.get(
+            reverse('posts:profile_unfollow',
+                    kwargs={'username': self.author.username})
+        )
+        self.assertEqual(self.timeline_post_ids(), set())
+
+    def test_follow_index_reads_timeline_in_order(self):
+        """Страница подписок выводит посты ленты от новых к старым"""
+        Follow.objects.create(user=self.follower, author=self.author)
+        new_post = Post.objects.create(author=self.author, text='Новый пост')
+        response = self.follower_client.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            list(response.context['page_obj']),
+            [new_post, self.old_post]
+        )
+
+
+@override_settings(FEED_CELEBRITY_FOLLOWERS=2,
+                   FEED_CELEBRITY_DEMOTE_FOLLOWERS=1)
+class HybridFeedTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.celebrity = User.objects.create_user(username='Celebrity')
+        cls.author = User.objects.create_user(username='Author')
+        cls.reader = User.objects.create_user(username='Reader')
+        cls.fan = User.objects.create_user(username='Fan')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        Follow.objects.create(user=self.reader, author=self.celebrity)
+        Follow.objects.create(user=self.fan, author=self.celebrity)
+        self.posts = [
+            Post.objects.create(
+                author=(self.celebrity, self.author)[i % 2],
+                text=f'Пост {i}',
+            ) for i in range(7)
+        ]
+
+    def test_celebrity_posts_not_fanned_out(self):
+        """Посты знаменитости не раскладываются по лентам, но
+        учитываются в метриках
+        """
+        self.assertFalse(
+            TimelineEntry.objects.filter(
+                post__author=self.celebrity
+            ).exists()
+        )
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.reader).count(), 3
+        )
+        stats = fan_out_stats()
+        self.assertEqual(stats['skipped'], 4)
+        self.assertEqual(stats['posts'], 3)
+        self.assertEqual(stats['rows'], 3)
+
+    def test_hybrid_feed_merges_sources_by_date(self):
+        """Лента сливает разложенные посты и посты знаменитости по дате"""
+        feed = timeline_posts(self.reader)
+        self.assertIsInstance(feed, HybridFeed)
+        expected = sorted(
+            self.posts, key=lambda post: (post.pub_date, post.pk),
+            reverse=True
+        )
+        self.assertEqual(feed.count(), 7)
+        self.assertEqual(feed[0:7], expected)
+        self.assertEqual(feed[2:5], expected[2:5])
+        self.assertEqual(feed[3], expected[3])
+
+    def test_follow_index_pages_hybrid_feed(self):
+        """Страница подписок листает гибридную ленту обоими пагинаторами"""
+        client = Client()
+        client.force_login(self.reader)
+        response = client.get(reverse('posts:follow_index'))
+        self.assertEqual(len(response.context['page_obj']), 7)
+        with override_settings(KEYSET_PAGINATION=True):
+            response = client.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            list(response.context['page_obj']),
+            list(Post.objects.order_by('-pub_date', '-pk'))
+        )
+
+    def celebrity_entries(self):
+        return TimelineEntry.objects.filter(
+            user=self.reader,
+            post__author=self.celebrity,
+        ).count()
+
+    def test_unfollows_at_boundary_keep_status(self):
+        """Отписки и подписки у порога не снимают статус знаменитости
+        и не раскладывают ее посты по лентам
+        """
+        for _ in range(3):
+            Follow.objects.filter(
+                user=self.fan, author=self.celebrity
+            ).delete()
+            self.assertTrue(is_celebrity(self.celebrity.pk))
+            Follow.objects.create(user=self.fan, author=self.celebrity)
+        Follow.objects.filter(user=self.fan, author=self.celebrity).delete()
+        call_command('demote_celebrities', stdout=StringIO())
+        self.assertTrue(is_celebrity(self.celebrity.pk))
+        self.assertEqual(self.celebrity_entries(), 0)
+        self.assertIsInstance(timeline_posts(self.reader), HybridFeed)
+
+    @override_settings(FEED_CELEBRITY_DEMOTE_FOLLOWERS=2)
+    def test_demoted_author_fanned_out_to_followers(self):
+        """Отписка не раскладывает посты сама; когда подписчиков меньше
+        нижнего порога, команда demote_celebrities снимает статус и
+        раскладывает посты оставшимся подписчикам
+        """
+        Follow.objects.filter(user=self.fan, author=self.celebrity).delete()
+        self.assertEqual(self.celebrity_entries(), 0)
+        self.assertIsInstance(timeline_posts(self.reader), HybridFeed)
+        call_command('demote_celebrities', stdout=StringIO())
+        self.assertFalse(is_celebrity(self.celebrity.pk))
+        self.assertEqual(self.celebrity_entries(), 4)
+        self.assertNotIsInstance(timeline_posts(self.reader), HybridFeed)
+        Post.objects.create(author=self.celebrity, text='Новый пост')
+        self.assertEqual(self.celebrity_entries(), 5)
+
+    @override_settings(FEED_CELEBRITY_DEMOTE_FOLLOWERS=3)
+    def test_unfollow_during_demotion(self):
+        """Подписчик, отписавшийся во время раскладки, не получает
+        посты автора в ленту
+        """
+        insert_entries = feed._insert_entries
+
+        def unfollow_then_insert(entries):
+            entries = list(entries)
+            Follow.objects.filter(
+                user=self.fan, author=self.celebrity
+            ).delete()
+            insert_entries(entries)
+
+        with mock.patch.object(
+            feed, '_insert_entries', side_effect=unfollow_then_insert
+        ):
+            call_command('demote_celebrities', stdout=StringIO())
+        self.assertFalse(is_celebrity(self.celebrity.pk))
+        self.assertEqual(self.celebrity_entries(), 4)
+        self.assertFalse(
+            TimelineEntry.objects.filter(user=self.fan).exists()
+        )
@@ -1,11 +1,16 @@
 import shutil
 import tempfile
+from http import HTTPStatus
+from io import BytesIO
+from unittest import mock
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.forms.models import BaseModelForm
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from PIL import Image
 
 from posts.forms import PostForm
 from posts.models import Comment, Group, Post
@@ -72,7 +77,75 @@ class PostCreateFormTests(TestCase):
         self.assertEqual(post.author, self.user)
         self.assertEqual(post.text, form_data['text'])
         self.assertEqual(post.group, self.group)
-        self.assertEqual(post.image, f'posts/{uploaded}')
+        self.assertRegex(post.image.name, r'^posts/[0-9a-f]{64}\.jpg$')
+
+    @override_settings(IMAGE_MAX_SIZE=(100, 100))
+    def test_image_normalized_on_upload(self):
+        """Картинка уменьшается и сохраняется в progressive JPEG
+        без EXIF, размеры записываются в пост
+        """
+        exif = Image.Exif()
+        exif[0x0110] = 'Camera'
+        exif[0x0112] = 6
+        buffer = BytesIO()
+        Image.new('RGBA', (400, 200), (255, 0, 0, 128)).save(
+            buffer, format='PNG', exif=exif
+        )
+        form = PostForm(
+            data={'text': 'Снимок с камеры'},
+            files={'image': SimpleUploadedFile(
+                'camera.png', buffer.getvalue(), content_type='image/png'
+            )},
+        )
+        self.assertTrue(form.is_valid(), form.errors)
+        post = form.save(commit=False)
+        post.author = self.user
+        post.save()
+        self.assertRegex(post.image.name, r'^posts/[0-9a-f]{64}\.jpg$')
+        self.assertEqual((post.image_width, post.image_height), (50, 100))
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.format, 'JPEG')
+            self.assertEqual(image.size, (50, 100))
+            self.assertTrue(image.info.get('progressive'))
+            self.assertNotIn('exif', image.info)
+
+    @override_settings(IMAGE_MAX_PIXELS=100)
+    def test_too_large_image_rejected(self):
+        """Картинка больше IMAGE_MAX_PIXELS не принимается"""
+        buffer = BytesIO()
+        Image.new('RGB', (20, 20)).save(buffer, format='PNG')
+        form = PostForm(
+            data={'text': 'Огромная картинка'},
+            files={'image': SimpleUploadedFile(
+                'huge.png', buffer.getvalue(), content_type='image/png'
+            )},
+        )
+        self.assertFalse(form.is_valid())
+        self.assertIn('image', form.errors)
+
+    def test_truncated_image_rejected(self):
+        """Обрезанная картинка - ошибка формы, а не ошибка сервера"""
+        buffer = BytesIO()
+        Image.effect_noise((200, 200), 64).convert('RGB').save(
+            buffer, format='JPEG'
+        )
+        truncated = buffer.getvalue()[:len(buffer.getvalue()) // 2]
+        posts_count = Post.objects.count()
+        response = self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={
+                'text': 'Обрезанная картинка',
+                'image': SimpleUploadedFile(
+                    'broken.jpg', truncated, content_type='image/jpeg'
+                ),
+            },
+        )
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertFormError(
+            response, 'form', 'image',
+            'Картинка повреждена или загружена не полностью.',
+        )
+        self.assertEqual(Post.objects.count(), posts_count)
 
     def test_edit_post(self):
         """Валидная форма редактирует запись в Post."""
@@ -101,6 +174,94 @@ class PostCreateFormTests(TestCase):
             ).exists()
         )
 
+    def test_edit_post_keeps_comments_count(self):
+        """Редактирование не затирает комментарии, добавленные после
+        чтения поста
+        """
+        post = Post.objects.create(author=self.user, text='Тестовый текст')
+        is_valid = PostForm.is_valid
+
+        def comment_then_validate(form):
+            Comment.objects.create(post=post, author=self.user, text='Новый')
+            return is_valid(form)
+
+        with mock.patch.object(
+            PostForm, 'is_valid', autospec=True,
+            side_effect=comment_then_validate,
+        ):
+            self.authorized_client.post(
+                reverse('posts:post_edit', kwargs={'post_id': post.pk}),
+                data={'text': 'Отредактированный тестовый текст'},
+            )
+        post.refresh_from_db()
+        self.assertEqual(post.text, 'Отредактированный тестовый текст')
+        self.assertEqual(post.comments_count, 1)
+
+    def test_admin_add_post(self):
+        """Суперпользователь добавляет пост в админке, картинка
+        нормализуется
+        """
+        admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='admin'
+        )
+        client = Client()
+        client.force_login(admin)
+        buffer = BytesIO()
+        Image.new('RGB', (40, 20)).save(buffer, format='PNG')
+        response = client.post(reverse('admin:posts_post_add'), data={
+            'text': 'Пост из админки',
+            'author': self.user.pk,
+            'group': self.group.pk,
+            'image': SimpleUploadedFile(
+                'admin.png', buffer.getvalue(), content_type='image/png'
+            ),
+        })
+        self.assertRedirects(response, reverse('admin:posts_post_changelist'))
+        post = Post.objects.get(text='Пост из админки')
+        self.assertEqual(post.author, self.user)
+        self.assertRegex(post.image.name, r'^posts/[0-9a-f]{64}\.jpg$')
+        self.assertEqual((post.image_width, post.image_height), (40, 20))
+
+    def test_admin_edit_keeps_comments_count(self):
+        """Изменение поста в админке и в списке не затирает комментарии,
+        добавленные после чтения поста
+        """
+        admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='admin'
+        )
+        client = Client()
+        client.force_login(admin)
+        post = Post.objects.create(author=self.user, text='Тестовый текст')
+        is_valid = BaseModelForm.is_valid
+
+        def comment_then_validate(form):
+            if getattr(form, 'instance', None) == post:
+                Comment.objects.create(
+                    post=post, author=self.user, text='Новый'
+                )
+            return is_valid(form)
+
+        with mock.patch.object(
+            BaseModelForm, 'is_valid', autospec=True,
+            side_effect=comment_then_validate,
+        ):
+            client.post(
+                reverse('admin:posts_post_change', args=[post.pk]),
+                data={'text': 'Текст из админки', 'author': self.user.pk},
+            )
+            client.post(reverse('admin:posts_post_changelist'), data={
+                'form-TOTAL_FORMS': 1,
+                'form-INITIAL_FORMS': 1,
+                'form-0-id': post.pk,
+                'form-0-group': self.group.pk,
+                '_save': 'Сохранить',
+            })
+        post.refresh_from_db()
+        self.assertEqual(post.text, 'Текст из админки')
+        self.assertEqual(post.group, self.group)
+        self.assertTrue(post.comments.exists())
+        self.assertEqual(post.comments_count, post.comments.count())
+
     def test_fields_label_and_help_text(self):
         """Проверяем label и help_text форм создания и редактирования поста."""
         label_and_help_text_list = {
@@ -0,0 +1,95 @@
+import re
+from importlib.util import find_spec
+from io import StringIO
+from unittest import skipUnless
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from posts.models import Follow, Group, Post
+
+User = get_user_model()
+
+JINJA2_TEMPLATES = [
+    'posts/index.html',
+    'posts/group_list.html',
+    'posts/profile.html',
+    'posts/follow.html',
+    'posts/includes/post_card.html',
+]
+
+
+def normalize(html):
+    """Разметка без различий в пробелах между шаблонизаторами"""
+    html = re.sub(r'\s+', ' ', html)
+    return re.sub(r'\s*([<>])\s*', r'\1', html).strip()
+
+
+@skipUnless(find_spec('jinja2'), 'Jinja2 не установлен')
+class Jinja2TemplatesTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(
+            username='Author', first_name='Лев', last_name='Толстой'
+        )
+        cls.follower = User.objects.create_user(username='Follower')
+        cls.group = Group.objects.create(
+            title='Группа', slug='test-slug', description='Описание'
+        )
+        Post.objects.bulk_create(
+            Post(author=cls.author, group=cls.group, text=f'Пост {i}')
+            for i in range(13)
+        )
+        Follow.objects.create(user=cls.follower, author=cls.author)
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.follower)
+
+    def get(self, url):
+        cache.clear()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_feed_pages_same_as_django_templates(self):
+        """Страницы лент, отрендеренные Jinja2, совпадают с шаблонами
+        Django с точностью до пробелов
+        """
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:index') + '?page=2',
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile',
+                    kwargs={'username': self.author.username}),
+            reverse('posts:follow_index'),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                django_html = self.get(url).content.decode()
+                with override_settings(JINJA2_TEMPLATES=JINJA2_TEMPLATES):
+                    response = self.get(url)
+                self.assertTemplateNotUsed(response, 'posts/index.html')
+                self.assertEqual(
+                    normalize(response.content.decode()),
+                    normalize(django_html),
+                )
+
+    def test_templates_switched_per_setting(self):
+        """Jinja2 рендерит только шаблоны из JINJA2_TEMPLATES"""
+        with override_settings(JINJA2_TEMPLATES=['posts/index.html']):
+            response = self.get(reverse('posts:index'))
+            self.assertTemplateNotUsed(response, 'posts/index.html')
+            response = self.get(
+                reverse('posts:group_list', kwargs={'slug': self.group.slug})
+            )
+            self.assertTemplateUsed(response, 'posts/group_list.html')
+
+    def test_template_bench(self):
+        out = StringIO()
+        call_command('template_bench', repeat=1, stdout=out)
+        self.assertIn('Jinja2:', out.getvalue())
@@ -0,0 +1,91 @@
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+
+from posts.forms import PostForm
+from posts.images import cleanup_media
+from posts.models import MediaFile, Post
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+User = get_user_model()
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class MediaStorageTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='HasNoName')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def create_post(self, filename='small.gif'):
+        form = PostForm(
+            data={'text': 'Пост с картинкой'},
+            files={'image': SimpleUploadedFile(
+                filename, SMALL_GIF, content_type='image/gif'
+            )},
+        )
+        self.assertTrue(form.is_valid(), form.errors)
+        post = form.save(commit=False)
+        post.author = self.user
+        post.save()
+        return post
+
+    def test_same_image_stored_once(self):
+        """Одинаковые картинки хранятся одним файлом с двумя ссылками"""
+        first = self.create_post('first.gif')
+        second = self.create_post('second.gif')
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertEqual(
+            os.listdir(os.path.dirname(first.image.path)),
+            [os.path.basename(first.image.name)],
+        )
+        self.assertEqual(MediaFile.objects.get(name=first.image.name).refs, 2)
+
+    def test_file_removed_only_without_refs(self):
+        """cleanup_media удаляет файл, только когда на него не ссылается
+        ни один пост
+        """
+        first = self.create_post()
+        second = self.create_post()
+        name, path = first.image.name, first.image.path
+        Post.objects.filter(pk=first.pk).delete()
+        self.assertEqual(cleanup_media(grace=0), 0)
+        self.assertTrue(os.path.exists(path))
+        Post.objects.filter(pk=second.pk).delete()
+        media_file = MediaFile.objects.get(name=name)
+        self.assertEqual(media_file.refs, 0)
+        self.assertIsNotNone(media_file.released)
+        self.assertEqual(cleanup_media(grace=60), 0)
+        self.assertEqual(cleanup_media(grace=0), 1)
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(MediaFile.objects.filter(name=name).exists())
+
+    def test_cleanup_keeps_referenced_file(self):
+        """Разошедшийся счетчик не приводит к удалению нужного файла"""
+        post = self.create_post()
+        MediaFile.objects.filter(name=post.image.name).update(
+            refs=0, released='2000-01-01T00:00:00Z'
+        )
+        self.assertEqual(cleanup_media(grace=0), 0)
+        self.assertTrue(os.path.exists(post.image.path))
+        self.assertEqual(MediaFile.objects.get(name=post.image.name).refs, 1)
@@ -0,0 +1,89 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Group, Post
+from posts.search import FTS_TABLE
+
+User = get_user_model()
+
+
+def plan_problems(sql):
+    """Строки EXPLAIN QUERY PLAN с полным просмотром таблицы или
+    сортировкой во временном B-дереве
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+        details = [row[-1] for row in cursor.fetchall()]
+    return [
+        detail for detail in details
+        if 'TEMP B-TREE' in detail
+        or detail.startswith('SCAN ') and not (
+            'USING INDEX' in detail
+            or 'USING COVERING INDEX' in detail
+            or 'VIRTUAL TABLE' in detail
+            or detail == 'SCAN CONSTANT ROW'
+        )
+    ]
+
+
+class QueryPlanTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='HasNoName')
+        cls.author = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        Follow.objects.create(user=cls.user, author=cls.author)
+        for i in range(15):
+            cls.post = Post.objects.create(
+                author=cls.author,
+                text=f'Тестовый текст {i}',
+                group=cls.group,
+            )
+        for i in range(25):
+            Comment.objects.create(
+                author=cls.user,
+                post=cls.post,
+                text=f'Комментарий {i}',
+            )
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+        cache.clear()
+
+    def test_view_queries_use_indexes(self):
+        """Запросы лент, профиля, комментариев и подписок идут по
+        индексам: без полного просмотра таблиц и сортировки
+        """
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:index') + '?page=2',
+            reverse('posts:index') + '?cursor=',
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': 'author'}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+            reverse('posts:post_comments', kwargs={'post_id': self.post.pk}),
+            reverse('posts:follow_index'),
+            reverse('posts:search') + '?q=Тестовый',
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                cache.clear()
+                with CaptureQueriesContext(connection) as context:
+                    self.authorized_client.get(url)
+                for query in context.captured_queries:
+                    sql = query['sql']
+                    # совпадения FTS сортируются по релевантности bm25,
+                    # индекса для такой сортировки нет
+                    if not sql.startswith('SELECT') or FTS_TABLE in sql:
+                        continue
+                    self.assertEqual(plan_problems(sql), [], sql)
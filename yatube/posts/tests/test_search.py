@@ -0,0 +1,125 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.sql import emit_post_migrate_signal
+from django.db import DEFAULT_DB_ALIAS, connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils.http import urlsafe_base64_encode
+
+from posts.models import Post
+from posts.search import (FTS_TABLE, FTS_TRIGGERS, match_expression,
+                          search_posts)
+
+User = get_user_model()
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='HasNoName')
+        cls.admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='pass'
+        )
+        cls.rare = Post.objects.create(author=cls.user, text='Ежик в тумане')
+        cls.often = Post.objects.create(
+            author=cls.user, text='Туман, туман, снова туман над рекой'
+        )
+        Post.objects.create(author=cls.user, text='Солнечный день')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_match_expression(self):
+        """Запрос превращается в безопасное выражение MATCH"""
+        self.assertEqual(match_expression('ежик тум'), '"ежик" "тум"*')
+        self.assertEqual(match_expression('"OR ('), '"OR"*')
+        self.assertIsNone(match_expression(' ?! '))
+
+    def test_search_ranks_results(self):
+        """Найдены все посты со словом, более релевантные первыми"""
+        page = search_posts('туман', 10)
+        self.assertEqual(list(page), [self.often, self.rare])
+        self.assertEqual(list(search_posts('тума', 10)), list(page))
+        self.assertEqual(list(search_posts('дождь', 10)), [])
+
+    def test_index_follows_post_changes(self):
+        """Триггеры обновляют индекс при изменении и удалении постов"""
+        Post.objects.filter(pk=self.rare.pk).update(text='Ежик в лесу')
+        self.assertEqual(list(search_posts('ежик лес', 10)), [self.rare])
+        self.assertEqual(list(search_posts('туман', 10)), [self.often])
+        Post.objects.filter(pk=self.often.pk).delete()
+        self.assertEqual(list(search_posts('туман', 10)), [])
+
+    def test_search_cursor_pagination(self):
+        """Результаты листаются курсором без повторов"""
+        Post.objects.bulk_create(
+            Post(author=self.user, text=f'Туман номер {i}') for i in range(5)
+        )
+        first = search_posts('туман', 4)
+        self.assertTrue(first.has_next())
+        second = search_posts('туман', 4, cursor=first.next_cursor)
+        self.assertFalse(second.has_next())
+        found = [post.pk for post in first + second]
+        self.assertEqual(len(found), 7)
+        self.assertEqual(len(set(found)), 7)
+
+    def test_broken_cursor_returns_first_page(self):
+        """Поврежденный курсор или курсор с id вне диапазона INTEGER
+        открывает первую страницу
+        """
+        for raw in (b'abc', b'1.0|99999999999999999999', b'nan|1'):
+            with self.subTest(cursor=raw):
+                response = self.client.get(reverse('posts:search'), {
+                    'q': 'туман', 'cursor': urlsafe_base64_encode(raw),
+                })
+                self.assertEqual(
+                    list(response.context['page_obj']),
+                    [self.often, self.rare],
+                )
+
+    def test_search_page(self):
+        """Страница поиска выводит найденные посты"""
+        response = self.client.get(reverse('posts:search'), {'q': 'ежик'})
+        self.assertContains(response, 'Ежик в тумане')
+        self.assertNotContains(response, 'Солнечный день')
+
+    def test_admin_search_uses_index(self):
+        """Поиск в админке идет по индексу, а не по LIKE"""
+        client = Client()
+        client.force_login(self.admin)
+        url = reverse('admin:posts_post_changelist')
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(url, {'q': 'ежик'})
+        self.assertEqual(
+            list(response.context['cl'].result_list), [self.rare]
+        )
+        sql = ' '.join(query['sql'] for query in context.captured_queries)
+        self.assertIn('MATCH', sql)
+        self.assertNotIn('LIKE', sql)
+
+    def test_rebuild_command(self):
+        """Команда восстанавливает очищенный индекс"""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('delete-all')"
+            )
+        self.assertEqual(list(search_posts('ежик', 10)), [])
+        call_command('rebuild_search_index', stdout=open('/dev/null', 'w'))
+        self.assertEqual(list(search_posts('ежик', 10)), [self.rare])
+
+    def test_index_restored_after_migrate(self):
+        """После миграции, пересоздавшей posts_post без триггеров, они
+        создаются заново, а индекс перестраивается
+        """
+        with connection.cursor() as cursor:
+            for trigger in FTS_TRIGGERS:
+                cursor.execute(f'DROP TRIGGER {trigger}')
+        Post.objects.filter(pk=self.rare.pk).update(text='Ежик в лесу')
+        self.assertEqual(list(search_posts('лес', 10)), [])
+        emit_post_migrate_signal(0, False, DEFAULT_DB_ALIAS)
+        self.assertEqual(list(search_posts('лес', 10)), [self.rare])
+        post = Post.objects.create(author=self.user, text='Лесная поляна')
+        self.assertEqual(list(search_posts('поляна', 10)), [post])
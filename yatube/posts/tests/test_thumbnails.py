@@ -0,0 +1,224 @@
+import json
+import os
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+from sorl.thumbnail import default
+
+from posts.forms import PostForm
+from posts.models import Group
+from posts.storage import ContentHashStorage
+from posts.thumbnails import (_generate, all_thumbnails, geometry_options,
+                              placeholders_rendered, post_thumbnail,
+                              prefetch_thumbnails, srcset_formats)
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+User = get_user_model()
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=2)
+class ThumbnailTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='HasNoName')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+
+    def create_post(self, content=SMALL_GIF, group=None):
+        form = PostForm(
+            data={'text': 'Пост с картинкой', 'group': group},
+            files={'image': SimpleUploadedFile(
+                'small.gif', content, content_type='image/gif'
+            )},
+        )
+        self.assertTrue(form.is_valid())
+        post = form.save(commit=False)
+        post.author = self.user
+        post.save()
+        return post
+
+    def test_no_etag_with_placeholder(self):
+        """Страница с заглушкой отдается без ETag: готовая миниатюра
+        не меняет поколений, и клиент получал бы 304 со старой заглушкой
+        """
+        post = self.create_post()
+        for url in (
+            reverse('posts:index'),
+            reverse('posts:post_detail', kwargs={'post_id': post.pk}),
+        ):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertContains(response, settings.THUMBNAIL_PLACEHOLDER)
+                self.assertNotIn('ETag', response)
+
+    def test_placeholder_until_thumbnail_ready(self):
+        """Пока миниатюры нет, выводится заглушка, а генерация уходит
+        в пул потоков
+        """
+        post = self.create_post()
+        url = reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        before = placeholders_rendered()
+        callbacks = []
+        with mock.patch('django.db.transaction.on_commit', callbacks.append):
+            response = self.client.get(url)
+        with mock.patch('posts.thumbnails.submit') as submit:
+            for callback in callbacks:
+                callback()
+        self.assertContains(response, settings.THUMBNAIL_PLACEHOLDER)
+        self.assertEqual(placeholders_rendered(), before + 1)
+        submit.assert_called_once()
+        name, geometry, options = submit.call_args[0]
+        self.assertEqual(name, post.image.name)
+        self.assertEqual(
+            [(geometry, options)], settings.THUMBNAIL_GEOMETRIES
+        )
+
+    def test_form_save_generates_all_geometries(self):
+        """Сохранение формы создает миниатюры всех размеров шаблонов"""
+        callbacks = []
+        with mock.patch('django.db.transaction.on_commit', callbacks.append):
+            post = self.create_post()
+        with override_settings(THUMBNAIL_WORKERS=0):
+            for callback in callbacks:
+                callback()
+        for geometry, options in settings.THUMBNAIL_GEOMETRIES:
+            with self.subTest(geometry=geometry):
+                thumbnail = default.backend.get_thumbnail(
+                    post.image, geometry, **options
+                )
+                self.assertFalse(getattr(thumbnail, 'is_placeholder', False))
+        url = reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        self.assertNotContains(
+            self.client.get(url), settings.THUMBNAIL_PLACEHOLDER
+        )
+
+    def test_prefetch_thumbnails_one_lookup_per_page(self):
+        """Миниатюры страницы читаются из KV-хранилища одним запросом,
+        тег берет их без обращений к хранилищу
+        """
+        callbacks = []
+        with mock.patch('django.db.transaction.on_commit', callbacks.append):
+            posts = [self.create_post() for _ in range(3)]
+        with override_settings(THUMBNAIL_WORKERS=0):
+            for callback in callbacks:
+                callback()
+        cache.clear()
+        with self.assertNumQueries(1):
+            prefetch_thumbnails(posts)
+        geometry = settings.THUMBNAIL_GEOMETRIES[0][0]
+        with self.assertNumQueries(0):
+            urls = [post_thumbnail(post, geometry).url for post in posts]
+        self.assertNotIn(settings.THUMBNAIL_PLACEHOLDER, ' '.join(urls))
+        with self.assertNumQueries(0):
+            prefetch_thumbnails(posts)
+
+    def test_picture_srcset_variants(self):
+        """Карточка выводит <picture> с вариантами всех ширин в доступных
+        форматах и явными размерами картинки
+        """
+        callbacks = []
+        with mock.patch('django.db.transaction.on_commit', callbacks.append):
+            post = self.create_post()
+        with override_settings(THUMBNAIL_WORKERS=0):
+            for callback in callbacks:
+                callback()
+        url = reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        response = self.client.get(url)
+        self.assertContains(response, '<picture>')
+        self.assertContains(response, 'width="960" height="339"')
+        for width in settings.THUMBNAIL_SRCSET_WIDTHS + [960]:
+            self.assertContains(response, f' {width}w')
+        for fmt, mime in (('JPEG', 'image/jpeg'), ('WEBP', 'image/webp')):
+            with self.subTest(fmt=fmt):
+                self.assertContains(
+                    response, f'type="{mime}"',
+                    count=int(fmt in srcset_formats()),
+                )
+        self.assertNotContains(response, settings.THUMBNAIL_PLACEHOLDER)
+
+    def test_webp_skipped_without_pillow_support(self):
+        """Без поддержки WebP в Pillow варианты создаются только в JPEG"""
+        with mock.patch('PIL.features.check', return_value=False):
+            self.assertEqual(srcset_formats(), ['JPEG'])
+            formats = {
+                options.get('format', 'JPEG')
+                for _, options in all_thumbnails()
+            }
+        self.assertEqual(formats, {'JPEG'})
+
+    def test_pool_generates_thumbnails_for_field_storage(self):
+        """Миниатюра из пула находится шаблоном: ключ KV-хранилища
+        строится по хранилищу поля Post.image
+        """
+        post = self.create_post()
+        self.assertIsInstance(post.image.storage, ContentHashStorage)
+        geometry = settings.THUMBNAIL_GEOMETRIES[0][0]
+        options = geometry_options(geometry)
+        _generate(post.image.name, geometry, options)
+        thumbnail = default.backend.get_thumbnail(
+            post.image, geometry, **options
+        )
+        self.assertFalse(getattr(thumbnail, 'is_placeholder', False))
+        self.assertIsNotNone(default.kvstore.get(thumbnail))
+
+    def test_regenerate_command_resumable(self):
+        """Команда создает миниатюры постов группы и продолжает
+        с места остановки
+        """
+        group = Group.objects.create(
+            title='Группа', slug='group', description='Описание'
+        )
+        posts = []
+        for color in ('red', 'green', 'blue'):
+            buffer = BytesIO()
+            Image.new('RGB', (4, 4), color).save(buffer, format='GIF')
+            posts.append(self.create_post(buffer.getvalue(), group.pk))
+        other = self.create_post()
+        state = os.path.join(TEMP_MEDIA_ROOT, 'state.json')
+        options = {
+            'workers': 0, 'group': 'group', 'batch_size': 2,
+            'state': state, 'stdout': StringIO(),
+        }
+        call_command('regenerate_thumbnails', **options)
+        geometry = settings.THUMBNAIL_GEOMETRIES[0][0]
+        for post in posts:
+            thumbnail = post_thumbnail(post, geometry)
+            self.assertFalse(getattr(thumbnail, 'is_placeholder', False))
+        self.assertTrue(
+            getattr(post_thumbnail(other, geometry), 'is_placeholder', False)
+        )
+        with open(state) as file:
+            progress = json.load(file)
+        self.assertEqual(progress['last_pk'], posts[-1].pk)
+        self.assertEqual(progress['images'], 3)
+        output = StringIO()
+        call_command('regenerate_thumbnails', **dict(options, stdout=output))
+        self.assertIn('Продолжение после поста', output.getvalue())
+        self.assertIn('картинок 3,', output.getvalue())
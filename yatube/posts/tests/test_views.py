@@ -10,8 +10,13 @@ from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core.paginator import Page
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from django.utils.http import http_date, urlsafe_base64_encode
 
+from core.query_budget import QueryBudgetTestMixin
+from posts.cache import render_post_cards
+from posts.counters import rebuild_counters
 from posts.models import Comment, Follow, Group, Post
+from posts.utils import CachedCountPaginator, posts_count_key
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
@@ -194,7 +199,11 @@ class PostPagesTests(TestCase):
         page_obj = response.context.get('page_obj')
         self.assertNotIn(new_post, page_obj)
 
+    @override_settings(THUMBNAIL_WORKERS=0)
     def test_index_page_cache(self):
+        """Главная страница отдается из кэша, пока посты не изменились,
+        и обновляется сразу после удаления поста
+        """
         new_post = Post.objects.create(
             author=self.user,
             text='New post text'
@@ -203,12 +212,40 @@ class PostPagesTests(TestCase):
         response = self.client.get(reverse('posts:index'))
         page_obj = response.context.get('page_obj')
         self.assertIn(new_post, page_obj)
+        with self.assertNumQueries(0):
+            response_cached = self.client.get(reverse('posts:index'))
+        self.assertEqual(response_cached.content, response.content)
         Post.objects.filter(pk=new_post_id).delete()
         response_post_del = self.client.get(reverse('posts:index'))
-        self.assertEqual(response_post_del.content, response.content)
-        cache.clear()
-        response_cache_del = self.client.get(reverse('posts:index'))
-        self.assertNotEqual(response_cache_del.content, response.content)
+        self.assertNotIn(new_post, response_post_del.context['page_obj'])
+        self.assertNotEqual(response_post_del.content, response.content)
+
+    def test_feed_page_rendered_again_on_deploy(self):
+        """С новой версией разметки страница ленты не берется из кэша"""
+        self.client.get(reverse('posts:index'))
+        with override_settings(FEED_CACHE_VERSION='2'):
+            with self.assertTemplateUsed('posts/index.html'):
+                self.client.get(reverse('posts:index'))
+
+    def test_feed_cache_invalidated_by_related_changes(self):
+        """Кэш лент группы и автора обновляется при изменении группы
+        и автора
+        """
+        group_url = reverse(
+            'posts:group_list', kwargs={'slug': self.group.slug}
+        )
+        profile_url = reverse(
+            'posts:profile', kwargs={'username': self.user.username}
+        )
+        self.client.get(group_url)
+        self.client.get(profile_url)
+        self.group.description = 'Новое описание группы'
+        self.group.save()
+        self.assertContains(self.client.get(group_url), 'Новое описание')
+        self.user.first_name = 'Новое'
+        self.user.last_name = 'Имя'
+        self.user.save()
+        self.assertContains(self.client.get(profile_url), 'Новое Имя')
 
     def test_follow_to_author(self):
         author = User.objects.create_user(username='Author')
@@ -280,6 +317,8 @@ class PaginatorViewsTest(TestCase):
                 group=cls.group
             ) for i in range(NUMBER_OF_POST_ON_ONE_PAGE + 4)
         ))
+        # bulk_create не отправляет сигналы, счетчики пересчитываем
+        rebuild_counters()
 
     def setUp(self):
         cache.clear()
@@ -328,3 +367,474 @@ class PaginatorViewsTest(TestCase):
                         queryset[post_num_start:post_num_end],
                         transform=lambda x: x
                     )
+
+
+@override_settings(KEYSET_PAGINATION=True)
+class KeysetPaginatorViewsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='HasNoName')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        Post.objects.bulk_create((
+            Post(
+                text=f'Тестовый текст {i}',
+                author=cls.user,
+                group=cls.group
+            ) for i in range(NUMBER_OF_POST_ON_ONE_PAGE * 2 + 3)
+        ))
+        cls.follower = User.objects.create_user(username='Follower')
+        Follow.objects.create(user=cls.follower, author=cls.user)
+
+    def setUp(self):
+        self.follower_client = Client()
+        self.follower_client.force_login(self.follower)
+        cache.clear()
+
+    def walk_pages(self, url, cursor_name):
+        """Проходит ленту курсорами в одном направлении до конца"""
+        posts = []
+        response = self.follower_client.get(url)
+        while True:
+            page_obj = response.context.get('page_obj')
+            self.assertIsInstance(page_obj, Page)
+            posts.extend(page_obj)
+            cursor = getattr(page_obj, cursor_name)
+            if cursor is None:
+                return posts, page_obj
+            response = self.follower_client.get(f'{url}?cursor={cursor}')
+
+    def test_keyset_pages_cover_feed_in_order(self):
+        """Курсоры next проходят ленты index, group_list, profile, follow
+        без пропусков и повторов
+        """
+        expected = list(Post.objects.order_by('-pub_date', '-pk'))
+        url_list = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.user.username}),
+            reverse('posts:follow_index'),
+        ]
+        for url in url_list:
+            with self.subTest(url=url):
+                cache.clear()
+                posts, last_page = self.walk_pages(url, 'next_cursor')
+                self.assertEqual(posts, expected)
+                self.assertTrue(last_page.has_previous())
+
+    def test_keyset_previous_cursor_returns_previous_page(self):
+        """Курсор previous возвращает ту же страницу, что была до next"""
+        url = reverse('posts:index')
+        first_page = self.client.get(url).context['page_obj']
+        second_page = self.client.get(
+            f'{url}?cursor={first_page.next_cursor}'
+        ).context['page_obj']
+        cache.clear()
+        back_page = self.client.get(
+            f'{url}?cursor={second_page.previous_cursor}'
+        ).context['page_obj']
+        self.assertEqual(list(back_page), list(first_page))
+        self.assertFalse(back_page.has_previous())
+
+    def test_keyset_broken_cursor_returns_first_page(self):
+        """Поврежденный курсор открывает первую страницу"""
+        cursors = [
+            'abc',
+            urlsafe_base64_encode(
+                b'n|2020-01-01T00:00:00+00:00|99999999999999999999'
+            ),
+            urlsafe_base64_encode(b'n|9999-12-31T23:59:59-14:00|1'),
+        ]
+        for cursor in cursors:
+            with self.subTest(cursor=cursor):
+                response = self.client.get(
+                    reverse('posts:index') + f'?cursor={cursor}'
+                )
+                page_obj = response.context['page_obj']
+                self.assertEqual(len(page_obj), NUMBER_OF_POST_ON_ONE_PAGE)
+                self.assertFalse(page_obj.has_previous())
+
+
+@override_settings(EXACT_COUNT_LIMIT=3)
+class CachedCountPaginatorTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='HasNoName')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def create_posts(self, number):
+        return [
+            Post.objects.create(
+                text=f'Тестовый текст {i}',
+                author=self.user,
+                group=self.group,
+            ) for i in range(number)
+        ]
+
+    def get_count(self, scope, pk=None):
+        queryset = {
+            'all': Post.objects.all(),
+            'author': Post.objects.filter(author_id=pk),
+            'group': Post.objects.filter(group_id=pk),
+        }[scope]
+        return CachedCountPaginator(
+            queryset,
+            NUMBER_OF_POST_ON_ONE_PAGE,
+            count_key=posts_count_key(scope, pk),
+        ).count
+
+    def test_small_set_counted_exactly_without_cache(self):
+        """Небольшой набор считается точно и не кладется в кэш"""
+        self.create_posts(2)
+        self.assertEqual(self.get_count('all'), 2)
+        self.assertIsNone(cache.get(posts_count_key('all')))
+
+    def test_large_set_count_cached_and_kept_by_signals(self):
+        """Количество большого набора кэшируется и поддерживается
+        сигналами создания, смены группы и удаления поста
+        """
+        posts = self.create_posts(5)
+        scopes = [
+            ('all', None),
+            ('author', self.user.pk),
+            ('group', self.group.pk),
+        ]
+        for scope, pk in scopes:
+            with self.subTest(scope=scope):
+                self.assertEqual(self.get_count(scope, pk), 5)
+                self.assertEqual(cache.get(posts_count_key(scope, pk)), 5)
+        self.create_posts(1)
+        posts[0].delete()
+        posts[1].delete()
+        for scope, pk in scopes:
+            with self.subTest(scope=scope):
+                self.assertEqual(self.get_count(scope, pk), 4)
+        post = posts[2]
+        post.group = None
+        post.save()
+        self.assertEqual(self.get_count('group', self.group.pk), 3)
+        self.assertEqual(self.get_count('all'), 4)
+
+    def test_elided_page_range_has_fixed_size(self):
+        """Окно номеров страниц не растет вместе с количеством страниц"""
+        paginator = CachedCountPaginator(list(range(10000)), 10)
+        ellipsis = paginator.ELLIPSIS
+        expected = {
+            1: [1, 2, 3, ellipsis, 1000],
+            500: [1, ellipsis, 498, 499, 500, 501, 502, ellipsis, 1000],
+            1000: [1, ellipsis, 998, 999, 1000],
+        }
+        for number, window in expected.items():
+            with self.subTest(number=number):
+                self.assertEqual(
+                    list(paginator.get_elided_page_range(number)), window
+                )
+        short = CachedCountPaginator(list(range(30)), 10)
+        self.assertEqual(list(short.get_elided_page_range(2)), [1, 2, 3])
+
+    def test_paginator_template_renders_window(self):
+        """Шаблон пагинатора выводит только окно ссылок на страницы"""
+        Post.objects.bulk_create(
+            Post(text=f'Текст {i}', author=self.user) for i in range(200)
+        )
+        response = self.client.get(reverse('posts:index') + '?page=10')
+        content = response.content.decode()
+        self.assertIn('?page=20"', content)
+        self.assertIn('?page=12"', content)
+        self.assertNotIn('?page=13"', content)
+        self.assertNotIn('?page=7"', content)
+
+
+class QueryBudgetViewsTest(QueryBudgetTestMixin, TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='HasNoName')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        for i in range(NUMBER_OF_POST_ON_ONE_PAGE):
+            author = User.objects.create_user(
+                username=f'author{i}',
+                first_name=f'Имя {i}',
+            )
+            group = Group.objects.create(
+                title=f'Группа {i}',
+                slug=f'group-{i}',
+                description='Описание',
+            )
+            Follow.objects.create(user=cls.user, author=author)
+            cls.post = Post.objects.create(
+                author=author,
+                text=f'Тестовый текст {i}',
+                group=group,
+            )
+            Comment.objects.create(
+                author=author,
+                post=cls.post,
+                text=f'Комментарий {i}',
+            )
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+        cache.clear()
+
+    def test_views_within_query_budget(self):
+        """Количество запросов страниц не зависит от числа постов
+        и комментариев на странице
+        """
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:group_list', kwargs={'slug': 'group-0'}),
+            reverse('posts:profile', kwargs={'username': 'author0'}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+            reverse('posts:post_comments', kwargs={'post_id': self.post.pk}),
+            reverse('posts:follow_index'),
+            reverse('posts:search') + '?q=Тестовый',
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                cache.clear()
+                self.assertWithinQueryBudget(self.authorized_client, url)
+
+
+class CommentsPaginationTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='HasNoName')
+        cls.post = Post.objects.create(author=cls.user, text='Тестовый пост')
+        for i in range(settings.NUMBER_OF_COMMENTS + 5):
+            Comment.objects.create(
+                author=cls.user,
+                post=cls.post,
+                text=f'Комментарий {i}',
+            )
+
+    def test_post_detail_shows_first_comments(self):
+        """На странице поста только первая порция комментариев"""
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        )
+        comments = response.context['post_comments']
+        self.assertEqual(len(comments), settings.NUMBER_OF_COMMENTS)
+        self.assertEqual(
+            comments[0].text,
+            f'Комментарий {settings.NUMBER_OF_COMMENTS + 4}'
+        )
+        self.assertTrue(comments.has_next())
+
+    def test_comments_fragment_continues_after_cursor(self):
+        """Фрагмент комментариев продолжает список с курсора"""
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        )
+        cursor = response.context['post_comments'].next_cursor
+        response = self.client.get(
+            reverse('posts:post_comments', kwargs={'post_id': self.post.pk}),
+            {'cursor': cursor},
+        )
+        self.assertTemplateUsed(response, 'posts/includes/comments.html')
+        self.assertTemplateNotUsed(response, 'base.html')
+        texts = [
+            comment.text for comment in response.context['post_comments']
+        ]
+        self.assertEqual(
+            texts, [f'Комментарий {i}' for i in range(4, -1, -1)]
+        )
+        self.assertNotContains(response, 'js-more-comments')
+
+
+class PostCardCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='HasNoName')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.post = Post.objects.create(
+            author=cls.user,
+            text='Тестовый пост',
+            group=cls.group,
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def render_card(self):
+        post = Post.objects.select_related('author', 'group').get(
+            pk=self.post.pk
+        )
+        return render_post_cards([post])[0]
+
+    def test_cached_card_not_rendered_again(self):
+        """Повторно карточка берется из кэша без рендеринга шаблона"""
+        card = self.render_card()
+        self.assertIn('Тестовый пост', card)
+        with self.assertTemplateNotUsed('posts/includes/post_card.html'):
+            self.assertEqual(self.render_card(), card)
+
+    def test_card_invalidated_by_post_author_and_group(self):
+        """Карточка обновляется при изменении поста, автора и группы"""
+        self.render_card()
+        self.post.text = 'Новый текст'
+        self.post.save()
+        self.assertIn('Новый текст', self.render_card())
+        self.user.username = 'NewName'
+        self.user.save()
+        self.assertIn('/profile/NewName/', self.render_card())
+        self.group.slug = 'new-slug'
+        self.group.save()
+        self.assertIn('/group/new-slug/', self.render_card())
+
+    def test_card_rendered_again_on_deploy(self):
+        """С новой версией разметки карточка рендерится заново"""
+        self.render_card()
+        with override_settings(FEED_CACHE_VERSION='2'):
+            with self.assertTemplateUsed('posts/includes/post_card.html'):
+                self.render_card()
+
+    def test_feed_page_renders_cards(self):
+        """Лента выводит карточки постов"""
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, 'Тестовый пост')
+        self.assertContains(response, '/group/test-slug/')
+
+
+class ConditionalGetTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='HasNoName')
+        cls.reader = User.objects.create_user(username='Reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.post = Post.objects.create(
+            author=cls.user,
+            text='Тестовый пост',
+            group=cls.group,
+        )
+        cls.urls = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': cls.group.slug}),
+            reverse('posts:profile', kwargs={'username': cls.user.username}),
+            reverse('posts:post_detail', kwargs={'post_id': cls.post.pk}),
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_not_modified_without_running_view(self):
+        """Страница с совпавшим ETag - 304 без шаблонов и запроса
+        страницы
+        """
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertIn('ETag', response)
+                with self.assertNumQueries(0):
+                    response = self.client.get(
+                        url, HTTP_IF_NONE_MATCH=response['ETag']
+                    )
+                self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+                self.assertFalse(response.content)
+
+    def test_no_last_modified(self):
+        """Last-Modified не отдается: по If-Modified-Since после удаления
+        поста клиент получил бы устаревшую страницу
+        """
+        url = reverse('posts:index')
+        newest = Post.objects.create(author=self.user, text='Новый пост')
+        response = self.client.get(url)
+        self.assertNotIn('Last-Modified', response)
+        newest.delete()
+        response = self.client.get(
+            url, HTTP_IF_MODIFIED_SINCE=http_date()
+        )
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertNotContains(response, 'Новый пост')
+
+    def test_etag_changes_on_deploy(self):
+        """С новой версией разметки старый ETag не дает 304"""
+        for url in self.urls:
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                with override_settings(FEED_CACHE_VERSION='2'):
+                    response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_etag_follows_renamed_author(self):
+        """После переименования автора ETag страниц поста и автора
+        меняется при его новых постах
+        """
+        author = User.objects.get(pk=self.user.pk)
+        post_url = reverse(
+            'posts:post_detail', kwargs={'post_id': self.post.pk}
+        )
+        self.client.get(post_url)
+        author.username = 'Renamed'
+        author.save()
+        profile_url = reverse(
+            'posts:profile', kwargs={'username': author.username}
+        )
+        etags = {url: self.client.get(url)['ETag']
+                 for url in (post_url, profile_url)}
+        Post.objects.create(author=author, text='Новый пост')
+        for url, etag in etags.items():
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+        response = self.client.get(reverse(
+            'posts:profile', kwargs={'username': self.user.username}
+        ))
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+    def test_etag_changes_on_edit_comment_and_user(self):
+        """ETag меняется при правке поста, новом комментарии, подписке
+        и у другого пользователя
+        """
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        etags = [self.client.get(url)['ETag']]
+        self.post.text = 'Новый текст'
+        self.post.save()
+        etags.append(self.client.get(url)['ETag'])
+        Comment.objects.create(
+            post=self.post, author=self.reader, text='Комментарий'
+        )
+        etags.append(self.client.get(url)['ETag'])
+        Follow.objects.create(user=self.reader, author=self.user)
+        etags.append(self.client.get(url)['ETag'])
+        self.client.force_login(self.reader)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etags[-1])
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        etags.append(response['ETag'])
+        self.assertEqual(len(set(etags)), len(etags))
+
+    def test_missing_post(self):
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': 0})
+        )
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+        self.assertNotIn('ETag', response)
@@ -0,0 +1,334 @@
+"""Фоновая генерация миниатюр.
+
+AsyncThumbnailBackend подменяет бэкенд sorl-thumbnail: если миниатюры
+еще нет в KV-хранилище, она не создается в запросе, а ставится в очередь
+пула из THUMBNAIL_WORKERS потоков, и шаблон получает заглушку. PostForm
+ставит в очередь все размеры из THUMBNAIL_GEOMETRIES сразу после
+сохранения картинки, так что к первому просмотру миниатюры обычно готовы.
+
+Страницы и карточки с заглушкой не кэшируются (placeholders_rendered).
+
+prefetch_thumbnails читает из KV-хранилища миниатюры всех постов страницы
+одним запросом к кэшу и одним к БД, шаблонный тег post_thumbnail берет
+их оттуда, не обращаясь к хранилищу для каждой картинки.
+
+Для каждого размера создаются варианты для srcset: ширины
+THUMBNAIL_SRCSET_WIDTHS в форматах THUMBNAIL_SRCSET_FORMATS (WebP - если
+Pillow собран с его поддержкой). Тег post_picture выводит их в <picture>.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.templatetags.static import static
+from PIL import features
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as default_settings
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import EMPTY_VALUE
+from sorl.thumbnail.models import KVStore
+from sorl.thumbnail.parsers import parse_geometry
+
+from .models import Post
+
+FAILED_TIMEOUT = 60 * 60
+MIME_TYPES = {'JPEG': 'image/jpeg', 'PNG': 'image/png', 'WEBP': 'image/webp'}
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_executor = None
+_pending = set()
+_state = threading.local()
+
+
+def placeholders_rendered():
+    """Сколько заглушек выведено в текущем потоке"""
+    return getattr(_state, 'placeholders', 0)
+
+
+def _format(options):
+    return options.get('format', thumbnail_settings.THUMBNAIL_FORMAT)
+
+
+def _failed_key(name, geometry_string, options):
+    return f'thumbnail:failed:{name}:{geometry_string}:{_format(options)}'
+
+
+class ThumbnailPlaceholder:
+    """Заглушка вместо еще не созданной миниатюры"""
+    is_placeholder = True
+
+    def __init__(self, geometry_string):
+        self.url = static(settings.THUMBNAIL_PLACEHOLDER)
+        self.width, self.height = parse_geometry(geometry_string)
+
+    @property
+    def x(self):
+        return self.width
+
+    @property
+    def y(self):
+        return self.height
+
+
+class AsyncThumbnailBackend(ThumbnailBackend):
+    def generate(self, file_, geometry_string, **options):
+        """Создает миниатюру сразу (бэкенд sorl по умолчанию)"""
+        return super().get_thumbnail(file_, geometry_string, **options)
+
+    def _thumbnail_name(self, source, geometry_string, options):
+        options = dict(options)
+        if thumbnail_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(thumbnail_settings, attr)
+            if value != getattr(default_settings, attr):
+                options.setdefault(key, value)
+        return self._get_thumbnail_filename(source, geometry_string, options)
+
+    def get_thumbnail(self, file_, geometry_string, **options):
+        if not settings.THUMBNAIL_WORKERS:
+            return self.generate(file_, geometry_string, **options)
+        if not file_:
+            raise ValueError('falsey file_ argument in get_thumbnail()')
+        source = ImageFile(file_)
+        name = self._thumbnail_name(source, geometry_string, options)
+        cached = default.kvstore.get(ImageFile(name, default.storage))
+        if cached:
+            return cached
+        if not cache.get(_failed_key(source.name, geometry_string, options)):
+            transaction.on_commit(
+                lambda: submit(source.name, geometry_string, options)
+            )
+        _state.placeholders = placeholders_rendered() + 1
+        return ThumbnailPlaceholder(geometry_string)
+
+
+def _executor_pool():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.THUMBNAIL_WORKERS,
+                thread_name_prefix='thumbnails',
+            )
+        return _executor
+
+
+def source_image(name):
+    """Картинка поста по имени файла в хранилище поля Post.image: от
+    хранилища зависят ключи и имена миниатюр sorl
+    """
+    return ImageFile(name, Post._meta.get_field('image').storage)
+
+
+def _generate(name, geometry_string, options):
+    try:
+        default.backend.generate(
+            source_image(name), geometry_string, **options
+        )
+    except Exception:
+        logger.exception('thumbnail %s %s failed', name, geometry_string)
+        cache.set(
+            _failed_key(name, geometry_string, options), True, FAILED_TIMEOUT
+        )
+    finally:
+        with _lock:
+            _pending.discard((name, geometry_string, _format(options)))
+        connections.close_all()
+
+
+def submit(name, geometry_string, options):
+    """Ставит миниатюру в очередь пула, если ее там еще нет"""
+    key = (name, geometry_string, _format(options))
+    with _lock:
+        if key in _pending:
+            return
+        _pending.add(key)
+    _executor_pool().submit(_generate, name, geometry_string, options)
+
+
+def enqueue_thumbnails(post):
+    """Все миниатюры картинки поста (all_thumbnails) - после фиксации
+    транзакции, когда файл уже сохранен
+    """
+    def run():
+        if not post.image:
+            return
+        for geometry_string, options in all_thumbnails():
+            if settings.THUMBNAIL_WORKERS:
+                submit(post.image.name, geometry_string, options)
+            else:
+                default.backend.generate(
+                    post.image, geometry_string, **options
+                )
+    transaction.on_commit(run)
+
+
+def regenerate_thumbnails(name, force=False):
+    """Создает все миниатюры картинки name (all_thumbnails), уже
+    созданные пропускаются; force - прежние миниатюры удаляются и
+    создаются заново. Возвращает количество миниатюр
+    """
+    source = source_image(name)
+    if force:
+        default.kvstore.delete_thumbnails(source)
+    thumbnails = all_thumbnails()
+    for geometry_string, options in thumbnails:
+        default.backend.generate(source, geometry_string, **options)
+    return len(thumbnails)
+
+
+def geometry_options(geometry_string):
+    """Опции миниатюры размера geometry_string из THUMBNAIL_GEOMETRIES"""
+    return dict(settings.THUMBNAIL_GEOMETRIES)[geometry_string]
+
+
+def srcset_formats():
+    """Форматы из THUMBNAIL_SRCSET_FORMATS, которые умеет сохранять Pillow"""
+    return [
+        fmt for fmt in settings.THUMBNAIL_SRCSET_FORMATS
+        if fmt != 'WEBP' or features.check('webp')
+    ]
+
+
+def thumbnail_variants(geometry_string):
+    """Варианты миниатюры для srcset по форматам: списки
+    (ширина, размер, опции) для ширин THUMBNAIL_SRCSET_WIDTHS меньше
+    исходной и самой исходной ширины; пропорции сохраняются
+    """
+    options = geometry_options(geometry_string)
+    width, height = parse_geometry(geometry_string)
+    widths = sorted(
+        {w for w in settings.THUMBNAIL_SRCSET_WIDTHS if w < width} | {width}
+    )
+    return {
+        fmt: [
+            (w, f'{w}x{round(height * w / width)}', dict(options, format=fmt))
+            for w in widths
+        ]
+        for fmt in srcset_formats()
+    }
+
+
+def all_thumbnails():
+    """Размеры и опции всех миниатюр шаблонов: THUMBNAIL_GEOMETRIES
+    и их варианты для srcset
+    """
+    thumbnails = {}
+    for geometry_string, options in settings.THUMBNAIL_GEOMETRIES:
+        thumbnails[geometry_string, _format(options)] = options
+        for variants in thumbnail_variants(geometry_string).values():
+            for _, variant, variant_options in variants:
+                thumbnails.setdefault(
+                    (variant, _format(variant_options)), variant_options
+                )
+    return [
+        (geometry_string, options)
+        for (geometry_string, _), options in thumbnails.items()
+    ]
+
+
+def _bulk_get_raw(keys):
+    """Значения KV-хранилища sorl (cached_db) по ключам: одним get_many
+    из кэша и одним запросом к БД для промахов
+    """
+    kv_cache = default.kvstore.cache
+    values = kv_cache.get_many(keys)
+    missed = [key for key in keys if key not in values]
+    if missed:
+        found = dict(
+            KVStore.objects.filter(key__in=missed).values_list(
+                'key', 'value'
+            )
+        )
+        loaded = {key: found.get(key, EMPTY_VALUE) for key in missed}
+        kv_cache.set_many(loaded, thumbnail_settings.THUMBNAIL_CACHE_TIMEOUT)
+        values.update(loaded)
+    return {
+        key: value for key, value in values.items()
+        if value and value != EMPTY_VALUE
+    }
+
+
+def prefetch_thumbnails(posts):
+    """Загружает миниатюры картинок постов всех размеров и форматов
+    (all_thumbnails) в post.prefetched_thumbnails
+    """
+    backend = default.backend
+    keys = {}
+    for post in posts:
+        post.prefetched_thumbnails = {}
+        if not post.image:
+            continue
+        source = ImageFile(post.image)
+        for geometry_string, options in all_thumbnails():
+            name = backend._thumbnail_name(source, geometry_string, options)
+            key = add_prefix(ImageFile(name, default.storage).key)
+            keys[key] = (post, (geometry_string, _format(options)))
+    if not keys:
+        return
+    for key, value in _bulk_get_raw(list(keys)).items():
+        post, thumbnail_key = keys[key]
+        post.prefetched_thumbnails[thumbnail_key] = (
+            deserialize_image_file(value)
+        )
+
+
+def post_thumbnail(post, geometry_string, options=None):
+    """Миниатюра картинки поста: из prefetch_thumbnails, иначе через
+    бэкенд (генерация или заглушка). По умолчанию опции берутся
+    из THUMBNAIL_GEOMETRIES
+    """
+    if not post.image:
+        return None
+    if options is None:
+        options = geometry_options(geometry_string)
+    prefetched = getattr(post, 'prefetched_thumbnails', {})
+    thumbnail_key = (geometry_string, _format(options))
+    if thumbnail_key in prefetched:
+        return prefetched[thumbnail_key]
+    return default.backend.get_thumbnail(
+        post.image, geometry_string, **options
+    )
+
+
+def post_picture(post, geometry_string):
+    """Данные для <picture>: img - миниатюра geometry_string с ее
+    размерами, sources - srcset вариантов по форматам. Еще не созданные
+    варианты в srcset не попадают (и ставятся в очередь), пока нет самой
+    миниатюры - выводится только заглушка
+    """
+    image = post_thumbnail(post, geometry_string)
+    if image is None:
+        return None
+    width, height = parse_geometry(geometry_string)
+    picture = {
+        'img': image,
+        'width': width,
+        'height': height,
+        'sizes': f'(max-width: {width}px) 100vw, {width}px',
+        'sources': [],
+    }
+    if getattr(image, 'is_placeholder', False):
+        return picture
+    for fmt, variants in thumbnail_variants(geometry_string).items():
+        srcset = []
+        for variant_width, variant, options in variants:
+            thumbnail = post_thumbnail(post, variant, options)
+            if not getattr(thumbnail, 'is_placeholder', False):
+                srcset.append(f'{thumbnail.url} {variant_width}w')
+        if srcset:
+            picture['sources'].append(
+                {'type': MIME_TYPES[fmt], 'srcset': ', '.join(srcset)}
+            )
+    return picture
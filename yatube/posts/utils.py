@@ -1,8 +1,211 @@
-from django.core.paginator import Paginator
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.encoding import force_bytes, force_text
+from django.utils.functional import cached_property
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
 
+CURSOR_NEXT = 'n'
+CURSOR_PREVIOUS = 'p'
+# наибольший id в SQLite (INTEGER - 64-битное целое со знаком)
+MAX_PK = 2 ** 63 - 1
 
-def paginator(request, some_list, number_of_elements):
-    pagination = Paginator(some_list, number_of_elements)
+
+def posts_count_key(scope, pk=None):
+    """Ключ кэша количества постов: вся лента, автор или группа"""
+    if pk is None:
+        return f'posts_count:{scope}'
+    return f'posts_count:{scope}:{pk}'
+
+
+def post_author_key(post_id):
+    """Ключ кэша id автора поста (области страницы поста)"""
+    return f'post_author:{post_id}'
+
+
+class CachedCountPaginator(Paginator):
+    """Пагинатор с кэшируемым количеством объектов.
+    Небольшие наборы считаются точно ограниченным запросом, для больших
+    COUNT(*) выполняется один раз и дальше берется из кэша. Значение в кэше
+    поддерживается сигналами Post (incr/decr), поэтому оно приблизительное
+    в пределах COUNT_CACHE_TIMEOUT. Известное заранее количество
+    (денормализованный счетчик) передается в known_count
+    """
+    ELLIPSIS = '…'
+    on_each_side = 2
+    on_ends = 1
+
+    def __init__(self, object_list, per_page, count_key=None,
+                 known_count=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count_key = count_key
+        self.known_count = known_count
+
+    def get_elided_page_range(self, number=1, on_each_side=None,
+                              on_ends=None):
+        """Номера страниц окном фиксированного размера вокруг number:
+        по on_each_side с каждой стороны и по on_ends на краях, пропуски
+        заменяются ELLIPSIS. Размер результата не зависит от num_pages
+        """
+        if on_each_side is None:
+            on_each_side = self.on_each_side
+        if on_ends is None:
+            on_ends = self.on_ends
+        number = self.validate_number(number)
+        num_pages = self.num_pages
+        if num_pages <= (on_each_side + on_ends) * 2:
+            yield from self.page_range
+            return
+        if number > 1 + on_each_side + on_ends + 1:
+            yield from range(1, on_ends + 1)
+            yield self.ELLIPSIS
+            yield from range(number - on_each_side, number + 1)
+        else:
+            yield from range(1, number + 1)
+        if number < num_pages - on_each_side - on_ends - 1:
+            yield from range(number + 1, number + on_each_side + 1)
+            yield self.ELLIPSIS
+            yield from range(num_pages - on_ends + 1, num_pages + 1)
+        else:
+            yield from range(number + 1, num_pages + 1)
+
+    @cached_property
+    def count(self):
+        if self.known_count is not None:
+            return self.known_count
+        if self.count_key is None:
+            return super().count
+        cached = cache.get(self.count_key)
+        if cached is not None:
+            return cached
+        limit = settings.EXACT_COUNT_LIMIT
+        pks = self.object_list.order_by().values_list('pk', flat=True)
+        probe = len(pks[:limit + 1])
+        if probe <= limit:
+            return probe
+        count = super().count
+        cache.set(self.count_key, count, settings.COUNT_CACHE_TIMEOUT)
+        return count
+
+
+class KeysetPage(Page):
+    """Страница курсорной пагинации: вместо номера страницы хранит
+    непрозрачные курсоры на соседние страницы
+    """
+    is_cursor = True
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        super().__init__(object_list, None, paginator)
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return '<Page (cursor)>'
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    @property
+    def next_cursor(self):
+        if not self._has_next:
+            return None
+        return self.paginator.encode_cursor(CURSOR_NEXT, self[-1])
+
+    @property
+    def previous_cursor(self):
+        if not self._has_previous:
+            return None
+        return self.paginator.encode_cursor(CURSOR_PREVIOUS, self[0])
+
+
+class KeysetPaginator(Paginator):
+    """Курсорный пагинатор по ключу (<поле даты>, id).
+    Страница выбирается условием по ключу и LIMIT, без OFFSET и COUNT(*),
+    поэтому время запроса не зависит от глубины листания
+    """
+    def __init__(self, object_list, per_page, key_field='pub_date'):
+        self.key_field = key_field
+        super().__init__(
+            object_list.order_by(f'-{key_field}', '-pk'),
+            per_page,
+        )
+
+    def encode_cursor(self, direction, obj):
+        value = getattr(obj, self.key_field).isoformat()
+        raw = f'{direction}|{value}|{obj.pk}'
+        return urlsafe_base64_encode(force_bytes(raw))
+
+    def decode_cursor(self, cursor):
+        """Возвращает (направление, значение ключа, pk) или None, если курсор
+        пустой или поврежден
+        """
+        try:
+            raw = force_text(urlsafe_base64_decode(cursor))
+            direction, value, pk = raw.split('|')
+            value = parse_datetime(value)
+            pk = int(pk)
+            if value is not None and timezone.is_aware(value):
+                # в запрос дата попадает в UTC: дата, которую нельзя
+                # в него перевести, сломала бы запрос
+                value = value.astimezone(timezone.utc)
+        except (TypeError, ValueError, UnicodeDecodeError, OverflowError):
+            return None
+        if (
+            value is None
+            or direction not in (CURSOR_NEXT, CURSOR_PREVIOUS)
+            or not 0 < pk <= MAX_PK
+        ):
+            return None
+        return direction, value, pk
+
+    def get_cursor_page(self, cursor):
+        """Страница после/до курсора; пустой или неверный курсор - первая"""
+        decoded = self.decode_cursor(cursor) if cursor else None
+        limit = self.per_page + 1
+        if decoded is None:
+            rows = list(self.object_list[:limit])
+            has_more = len(rows) > self.per_page
+            return KeysetPage(rows[:self.per_page], self, has_more, False)
+        direction, value, pk = decoded
+        key = self.key_field
+        if direction == CURSOR_NEXT:
+            rows = list(self.object_list.filter(
+                Q(**{f'{key}__lt': value}) | Q(**{key: value, 'pk__lt': pk})
+            )[:limit])
+            has_more = len(rows) > self.per_page
+            return KeysetPage(rows[:self.per_page], self, has_more, True)
+        rows = list(self.object_list.filter(
+            Q(**{f'{key}__gt': value}) | Q(**{key: value, 'pk__gt': pk})
+        ).order_by(key, 'pk')[:limit])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page][::-1]
+        return KeysetPage(rows, self, True, has_more)
+
+
+def paginator(request, some_list, number_of_elements, keyset=None,
+              count_key=None, count=None):
+    """Пагинация списка постов.
+    keyset=None - курсорный режим включается настройкой KEYSET_PAGINATION
+    или параметром cursor в запросе; count_key - ключ кэша количества
+    постов (см. posts_count_key); count - уже известное количество постов
+    """
+    if keyset is None:
+        keyset = settings.KEYSET_PAGINATION or 'cursor' in request.GET
+    if keyset:
+        pagination = KeysetPaginator(some_list, number_of_elements)
+        return pagination.get_cursor_page(request.GET.get('cursor'))
+    pagination = CachedCountPaginator(
+        some_list,
+        number_of_elements,
+        count_key=count_key,
+        known_count=count,
+    )
     page_number = request.GET.get('page')
     page_obj = pagination.get_page(page_number)
     return page_obj
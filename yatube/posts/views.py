@@ -1,23 +1,84 @@
 from django.contrib.auth import get_user_model
 from django.contrib.auth.decorators import login_required
+from django.core.cache import cache
+from django.db import transaction
 from django.shortcuts import get_object_or_404, redirect, render
-from django.views.decorators.cache import cache_page
 
-from yatube.settings import NUMBER_OF_POSTS
+from core.db_router import read_replica
+from core.query_budget import query_budget
+from yatube.settings import (FEED_CACHE_TIMEOUT, NUMBER_OF_COMMENTS,
+                             NUMBER_OF_POSTS)
+from .cache import cache_feed, conditional_page, versioned_key
+from .counters import user_stats
+from .feed import timeline_posts
 from .forms import CommentForm, PostForm
 from .models import Comment, Follow, Group, Post
-from .utils import paginator
+from .search import search_posts
+from .utils import (KeysetPaginator, paginator, post_author_key,
+                    posts_count_key)
 
 User = get_user_model()
 
 
-@cache_page(20, key_prefix='index_page')
+def index_scopes(request):
+    return ['posts', 'groups', 'users']
+
+
+def group_scopes(request, slug):
+    return [f'group:{slug}', 'groups', 'users']
+
+
+def profile_scopes(request, username):
+    """Области страницы автора; None - автора нет. id автора по имени
+    кэшируется до изменения любого пользователя (поколение users)
+    """
+    key = versioned_key(f'profile_author:{username}', ['users'])
+    author_id = cache.get(key)
+    if author_id is None:
+        author_id = User.objects.filter(username=username).values_list(
+            'pk', flat=True
+        ).first()
+        if author_id is None:
+            return None
+        cache.set(key, author_id, FEED_CACHE_TIMEOUT)
+    return [f'author:{author_id}', 'groups', 'users']
+
+
+def post_scopes(request, post_id):
+    """Области страницы поста: сам пост, его комментарии, автор (счетчики
+    подписчиков), пользователи и группы; None - поста нет.
+    id автора кэшируется, сигналы Post сбрасывают его при сохранении
+    """
+    key = post_author_key(post_id)
+    author_id = cache.get(key)
+    if author_id is None:
+        author_id = Post.objects.filter(pk=post_id).values_list(
+            'author_id', flat=True
+        ).first()
+        if author_id is None:
+            return None
+        cache.set(key, author_id, FEED_CACHE_TIMEOUT)
+    return [
+        f'card:post:{post_id}', f'comments:{post_id}', f'author:{author_id}',
+        'groups', 'users',
+    ]
+
+
+@conditional_page(index_scopes)
+@cache_feed(index_scopes)
+@read_replica
+@query_budget(4)
 def index(request):
     """Главная страница с настроенной пагинацией.
-    Настроено кэширование страницы
+    Страница кэшируется до изменения постов, групп или пользователей
     """
-    post_list = Post.objects.select_related('group').all()
-    page_obj = paginator(request, post_list, NUMBER_OF_POSTS)
+    post_list = Post.objects.select_related('author', 'group').all()
+    page_obj = paginator(
+        request,
+        post_list,
+        NUMBER_OF_POSTS,
+        count_key=posts_count_key('all'),
+    )
     context = {
         'index': True,
         'follow': False,
@@ -26,11 +87,20 @@ def index(request):
     return render(request, 'posts/index.html', context)
 
 
+@conditional_page(group_scopes)
+@cache_feed(group_scopes)
+@read_replica
+@query_budget(5)
 def group_posts(request, slug):
     """Страница постов в конкретной группе slug с настроенной пагинацией"""
     group = get_object_or_404(Group, slug=slug)
-    post_list = group.posts.all()
-    page_obj = paginator(request, post_list, NUMBER_OF_POSTS)
+    post_list = group.posts.select_related('author', 'group').all()
+    page_obj = paginator(
+        request,
+        post_list,
+        NUMBER_OF_POSTS,
+        count_key=posts_count_key('group', group.pk),
+    )
     context = {
         'group': group,
         'page_obj': page_obj,
@@ -38,13 +108,28 @@ def group_posts(request, slug):
     return render(request, 'posts/group_list.html', context)
 
 
+@conditional_page(profile_scopes)
+@cache_feed(profile_scopes)
+@read_replica
+@query_budget(6)
 def profile(request, username):
-    """Страница автора с его постами, можно подписаться/отписаться
-    (для авторизованных пользователей)
+    """Страница автора с его постами и счетчиками, можно
+    подписаться/отписаться (для авторизованных пользователей)
     """
-    author = get_object_or_404(User, username=username)
-    post_list = Post.objects.filter(author=author)
-    page_obj = paginator(request, post_list, NUMBER_OF_POSTS)
+    author = get_object_or_404(
+        User.objects.select_related('stats'),
+        username=username
+    )
+    author_stats = user_stats(author)
+    post_list = Post.objects.select_related('author', 'group').filter(
+        author=author
+    )
+    page_obj = paginator(
+        request,
+        post_list,
+        NUMBER_OF_POSTS,
+        count=author_stats.posts_count,
+    )
     current_user = request.user
     if current_user.is_authenticated:
         following = Follow.objects.filter(
@@ -56,27 +141,78 @@ def profile(request, username):
     context = {
         'following': following,
         'author': author,
+        'author_stats': author_stats,
         'page_obj': page_obj,
     }
     return render(request, 'posts/profile.html', context)
 
 
+def comments_page(request, post_id):
+    """Порция комментариев поста после курсора из запроса"""
+    comments = Comment.objects.select_related('author').filter(
+        post_id=post_id
+    )
+    pagination = KeysetPaginator(
+        comments,
+        NUMBER_OF_COMMENTS,
+        key_field='created',
+    )
+    return pagination.get_cursor_page(request.GET.get('cursor'))
+
+
+@conditional_page(post_scopes)
+@read_replica
+@query_budget(5)
 def post_detail(request, post_id):
     """Страница конкретного поста, с формой для написания комментария
-    (для авторизованных пользователей) и уже написанными комментариями
+    (для авторизованных пользователей) и первой порцией комментариев
     """
-    post = get_object_or_404(Post, pk=post_id)
+    post = get_object_or_404(
+        Post.objects.select_related('author__stats', 'group'),
+        pk=post_id
+    )
     form = CommentForm()
-    post_comments = Comment.objects.filter(post=post)
     context = {
         'post': post,
+        'author_stats': user_stats(post.author),
         'form': form,
-        'post_comments': post_comments,
+        'post_comments': comments_page(request, post_id),
     }
     return render(request, 'posts/post_detail.html', context)
 
 
+@read_replica
+@query_budget(1)
+def post_comments(request, post_id):
+    """Следующая порция комментариев поста HTML-фрагментом
+    (подгружается со страницы поста)
+    """
+    context = {
+        'post_id': post_id,
+        'post_comments': comments_page(request, post_id),
+    }
+    return render(request, 'posts/includes/comments.html', context)
+
+
+@read_replica
+@query_budget(4)
+def search(request):
+    """Полнотекстовый поиск по постам, самые релевантные первыми"""
+    query = request.GET.get('q', '')
+    page_obj = search_posts(
+        query,
+        NUMBER_OF_POSTS,
+        cursor=request.GET.get('cursor'),
+    )
+    context = {
+        'query': query,
+        'page_obj': page_obj,
+    }
+    return render(request, 'posts/search.html', context)
+
+
 @login_required
+@transaction.atomic
 def post_create(request):
     """Страница создания нового поста (для авторизованных пользователей
     "@login_required")
@@ -94,17 +230,23 @@ def post_create(request):
 def post_edit(request, post_id):
     """Страница редактирования поста (для авторизованного автора этого поста)
     """
-    if request.user != get_object_or_404(Post, pk=post_id).author:
+    post = get_object_or_404(Post, pk=post_id)
+    if request.user.pk != post.author_id:
         return redirect('posts:post_detail', post_id=post_id)
     is_edit = True
-    post = get_object_or_404(Post, pk=post_id)
     form = PostForm(
         request.POST or None,
         files=request.FILES or None,
         instance=post
     )
     if form.is_valid():
-        form.save()
+        post = form.save(commit=False)
+        # сохраняются только поля формы: comments_count меняется сигналами
+        # комментариев, значение, прочитанное до редактирования, затерло бы
+        # комментарии, добавленные за это время
+        post.save(update_fields=[
+            *PostForm.Meta.fields, 'image_width', 'image_height'
+        ])
         return redirect('posts:post_detail', post_id=post_id)
     return render(request, 'posts/create_post.html', {
         'form': form,
@@ -113,6 +255,7 @@ def post_edit(request, post_id):
 
 
 @login_required
+@transaction.atomic
 def add_comment(request, post_id):
     """Обработчик для создания комментария. Форма отображается на странице
     поста
@@ -121,17 +264,17 @@ def add_comment(request, post_id):
     if form.is_valid():
         comment = form.save(commit=False)
         comment.author = request.user
-        post = Post.objects.get(pk=post_id)
-        comment.post = post
+        comment.post = get_object_or_404(Post, pk=post_id)
         comment.save()
     return redirect('posts:post_detail', post_id=post_id)
 
 
 @login_required
+@read_replica
+@query_budget(5)
 def follow_index(request):
     """Страница с постами любимых авторов (для авторизованных)"""
-    current_user = request.user
-    post_list = Post.objects.filter(author__following__user=current_user).all()
+    post_list = timeline_posts(request.user).select_related('author', 'group')
     page_obj = paginator(request, post_list, NUMBER_OF_POSTS)
     context = {
         'index': False,
@@ -142,6 +285,7 @@ def follow_index(request):
 
 
 @login_required
+@transaction.atomic
 def profile_follow(request, username):
     """Подписка на автора"""
     author = get_object_or_404(User, username=username)
@@ -152,6 +296,7 @@ def profile_follow(request, username):
 
 
 @login_required
+@transaction.atomic
 def profile_unfollow(request, username):
     """Отписка от автора"""
     author = get_object_or_404(User, username=username)
@@ -1,4 +1,5 @@
 import os
+from importlib.util import find_spec
 
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -41,6 +42,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.db_router.ReplicaPinMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'debug_toolbar.middleware.DebugToolbarMiddleware',
@@ -65,6 +67,25 @@ TEMPLATES = [
     },
 ]
 
+# Jinja2 (необязательная зависимость из requirements-optional.txt,
+# core.jinja2): если установлен, шаблоны из JINJA2_TEMPLATES рендерятся
+# им, версии шаблонов для него - в templates/jinja2
+JINJA2_TEMPLATES = []
+if find_spec('jinja2') is not None:
+    TEMPLATES.insert(0, {
+        'BACKEND': 'core.jinja2.Jinja2',
+        'NAME': 'jinja2',
+        'DIRS': [os.path.join(TEMPLATES_DIR, 'jinja2')],
+        'APP_DIRS': False,
+        'OPTIONS': {
+            'environment': 'core.jinja2.environment',
+            'context_processors': [
+                'django.template.context_processors.request',
+                'django.contrib.auth.context_processors.auth',
+            ],
+        },
+    })
+
 WSGI_APPLICATION = 'yatube.wsgi.application'
 
 
@@ -72,9 +93,43 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # постоянные подключения (сек.) вместо нового на каждый запрос
+        'CONN_MAX_AGE': 60,
+        'OPTIONS': {
+            # ожидание блокировки записи (сек.) вместо "database is locked"
+            'timeout': 20,
+        },
     }
 }
 
+# Реплика для чтения (core.db_router): путь к копии файла БД из
+# переменной окружения, копия обновляется командой sync_replica
+REPLICA_DB_PATH = os.environ.get('YATUBE_REPLICA_DB')
+if REPLICA_DB_PATH:
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': REPLICA_DB_PATH,
+        'TEST': {'MIRROR': 'default'},
+    }
+REPLICA_DATABASES = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['core.db_router.ReplicaRouter']
+# допустимое отставание реплики (сек.): столько после записи
+# пользователь читает с основной БД и столько живут в кэше страницы,
+# прочитанные с реплики
+REPLICA_LAG_SECONDS = 10
+
+# PRAGMA для каждого нового подключения к SQLite (core.db):
+# WAL - читатели не блокируются писателем, synchronous=NORMAL в режиме
+# WAL безопасен для целостности, cache_size в КиБ (отрицательное число),
+# mmap_size в байтах
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -64000,
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -106,6 +161,18 @@ USE_TZ = True
 # Статика (стили и иконки)
 STATIC_URL = '/static/'
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
+# collectstatic собирает сюда файлы с хэшем в имени и их сжатые копии .gz
+# (core.staticfiles)
+STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
+STATICFILES_STORAGE = 'core.staticfiles.PrecompressedManifestStorage'
+# стили, из которых при collectstatic удаляются правила с классами,
+# не встречающимися в шаблонах
+STATIC_PRUNE_CSS = ['css/bootstrap.min.css']
+# классы, которые нельзя удалять, хотя их нет в шаблонах
+STATIC_PRUNE_KEEP = []
+# раздавать статику из STATIC_ROOT самим Django (когда перед ним нет
+# веб-сервера, отдающего STATIC_ROOT)
+STATIC_SERVE = True
 
 # Медиа (картинки к постам)
 MEDIA_URL = '/media/'
@@ -117,10 +184,33 @@ LOGIN_REDIRECT_URL = 'posts:index'
 # LOGOUT_REDIRECT_URL = 'posts:index'
 
 
-# Кэш (для главной страницы)
+# Кэш (страницы лент, количество постов): файл SQLite, общий для всех
+# процессов сервера (core.cache); в тестах - в памяти процесса.
+# Перед ним - L1 в памяти процесса для версионированных ключей; ключи,
+# которые меняются на месте (поколения, счетчики), читаются только из
+# общего кэша
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.cache.TieredCache',
+        'LOCATION': 'shared',
+        'OPTIONS': {
+            'L1_TIMEOUT': 5,
+            'L1_MAX_BYTES': 32 * 1024 * 1024,
+            'L1_BYPASS': [
+                'gen:',
+                'posts_count:',
+                'feed:fan_out:',
+                'cache_stats:',
+            ],
+        },
+    },
+    'shared': {
+        'BACKEND': 'core.cache.SQLiteCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache.sqlite3'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 50000,
+            'CULL_FREQUENCY': 4,
+        },
     }
 }
 
@@ -128,12 +218,74 @@ CACHES = {
 # Project constants
 # кол-во постов на странице
 NUMBER_OF_POSTS = 10
+# кол-во комментариев в одной порции на странице поста
+NUMBER_OF_COMMENTS = 20
+# курсорная пагинация лент (по ключу pub_date, id) вместо LIMIT/OFFSET
+KEYSET_PAGINATION = False
+# до скольких постов лента считается точно, без кэша
+EXACT_COUNT_LIMIT = 1000
+# время жизни закэшированного количества постов в ленте (сек.)
+COUNT_CACHE_TIMEOUT = 60 * 60
+# с какого числа подписчиков посты автора не раскладываются по лентам
+# подписчиков, а подмешиваются в ленту при чтении
+FEED_CELEBRITY_FOLLOWERS = 1000
+# ниже какого числа подписчиков знаменитость снова становится обычным
+# автором (команда demote_celebrities); разрыв с FEED_CELEBRITY_FOLLOWERS
+# не дает статусу переключаться туда и обратно при подписках и отписках
+FEED_CELEBRITY_DEMOTE_FOLLOWERS = 900
+# время жизни страниц лент в кэше (сек.); при записи страницы
+# устаревают сразу за счет версионированных ключей (posts.cache)
+FEED_CACHE_TIMEOUT = 60 * 60
+# версия разметки страниц: входит в ETag страниц и ключи кэша
+# отрендеренного HTML, поэтому после выкладки с новыми шаблонами клиенты
+# и кэш не отдают старый HTML. При выкладке задается переменной
+# окружения YATUBE_RELEASE (например, хэш коммита)
+FEED_CACHE_VERSION = os.environ.get('YATUBE_RELEASE', '1')
+# время жизни отрендеренных карточек постов в кэше (сек.)
+POST_CARD_CACHE_TIMEOUT = 60 * 60 * 24
 # кол-во отображаемых символов в имени поста
 CHAR_NUM_OBJECT_NAME_POST = 15
 # кол-во отображаемых символов в имени комментария
 CHAR_NUM_OBJECT_NAME_COMMENT = 10
 
 
+# Загружаемые картинки постов (posts.images): больше IMAGE_MAX_PIXELS
+# отклоняются, остальные уменьшаются до IMAGE_MAX_SIZE и сохраняются
+# в JPEG без метаданных
+IMAGE_MAX_PIXELS = 50 * 1000 * 1000
+IMAGE_MAX_SIZE = (2048, 2048)
+IMAGE_JPEG_QUALITY = 85
+# файлы картинок хранятся под именами по содержимому (posts.storage);
+# через сколько секунд после удаления последней ссылки на файл его можно
+# удалить командой cleanup_media
+MEDIA_CLEANUP_GRACE = 60 * 60 * 24
+
+# Миниатюры (sorl-thumbnail): генерируются в фоне пулом потоков
+# (posts.thumbnails), пока миниатюры нет - выводится заглушка
+THUMBNAIL_BACKEND = 'posts.thumbnails.AsyncThumbnailBackend'
+# кол-во потоков генерации; 0 - генерировать сразу, в запросе
+THUMBNAIL_WORKERS = 2
+# размеры и опции миниатюр, которые используют шаблоны
+THUMBNAIL_GEOMETRIES = [
+    ('960x339', {'crop': 'center', 'upscale': True}),
+]
+# ширины вариантов миниатюр для srcset (не больше ширины размера)
+THUMBNAIL_SRCSET_WIDTHS = [480, 720]
+# форматы вариантов в порядке предпочтения браузером; WEBP пропускается,
+# если Pillow собран без его поддержки
+THUMBNAIL_SRCSET_FORMATS = ['WEBP', 'JPEG']
+# заглушка вместо еще не готовой миниатюры (путь в static)
+THUMBNAIL_PLACEHOLDER = 'img/thumbnail_placeholder.svg'
+# KV-хранилище sorl - в общем кэше без L1: миниатюра, созданная другим
+# процессом, видна сразу
+THUMBNAIL_CACHE = 'shared'
+
+
+# Бюджет SQL-запросов view (core.query_budget): при превышении
+# выбрасывать исключение, а не только писать предупреждение в лог
+QUERY_BUDGET_RAISE = False
+
+
 # Email emulation
 EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
@@ -0,0 +1,25 @@
+"""Настройки для запуска тестов (manage.py test --settings, pytest.ini)"""
+import os
+import tempfile
+
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR, CACHES, DATABASES
+
+# общий кэш - в памяти: записи не переживают запуск тестов
+CACHES['shared']['LOCATION'] = ':memory:'
+
+# миниатюры генерируются сразу, в запросе: потоки пула не должны писать
+# во временный MEDIA_ROOT после его удаления. Тесты пула включают его
+# через override_settings
+THUMBNAIL_WORKERS = 0
+
+# реплика - отдельный файл, как при YATUBE_REPLICA_DB. Чтение с нее
+# включают только тесты реплик (REPLICA_DATABASES через override_settings)
+DATABASES['replica'] = {
+    **DATABASES['default'],
+    'NAME': os.path.join(BASE_DIR, 'replica.sqlite3'),
+    'TEST': {
+        'NAME': os.path.join(tempfile.gettempdir(), 'yatube_replica.sqlite3'),
+    },
+}
+REPLICA_DATABASES = []
@@ -1,7 +1,11 @@
+import re
+
 from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib import admin
-from django.urls import include, path
+from django.urls import include, path, re_path
+
+from core.staticfiles import serve as serve_static
 
 urlpatterns = [
     path('', include('posts.urls', namespace='posts')),
@@ -17,6 +21,13 @@ handler400 = 'core.views.bad_request'
 handler500 = 'core.views.server_error'
 handler403 = 'core.views.permission_denied'
 
+if settings.STATIC_SERVE:
+    # при DEBUG runserver раздает статику из STATICFILES_DIRS сам
+    urlpatterns += (re_path(
+        r'^%s(?P<path>.*)$' % re.escape(settings.STATIC_URL.lstrip('/')),
+        serve_static,
+    ),)
+
 if settings.DEBUG:
     import debug_toolbar
 